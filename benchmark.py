@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+Benchmark the job-generation and compilation paths of scripts in this repository using synthetic data.
+
+Example commands:
+    python benchmark.py --isolates 100000 --output bench_100k.json
+    python benchmark.py --isolates 100000 --output bench_new.json --baseline bench_100k.json
+
+Benchmarks:
+    import_readsets, import_assemblies: parsing sample sheets of fake FASTQ and FASTA files;
+    {tool}.create_job_script: generating job scripts in memory from each tool plugin for all isolates in queues of --queue isolates;
+    {tool}.main: the whole submission path of run_{tool}.py, including write_job_script and a stub qsub or sbatch;
+    genefinder_xml2tsv.main: compiling fake GeneFinder XML files into a TSV file.
+
+Notes:
+    1. Dependencies: Python >= 3.6.
+    2. Each benchmark is timed --repeats times (reporting the fastest run) and is run once more under tracemalloc to
+       measure the peak memory allocated by Python. Results are printed and saved as a JSON file.
+    3. Stubs of qsub and sbatch are put at the start of PATH, and time.sleep, which the submitters call between submissions, is
+       replaced with a no-op during benchmarks. Environmental variable PIPELINE_EVENT_LOG is unset during benchmarks, so
+       that submitters do not append events of fake isolates to a shared event log.
+
+Copyright (C) 2026 Yu Wan <wanyuac@126.com>
+Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
+First version: 19 Oct 2026; the latest update: 19 Oct 2026
+"""
+
+import os
+import sys
+import json
+import time
+import gzip
+import shutil
+import platform
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout, redirect_stderr
+from argparse import ArgumentParser
+import pipeline_modules
+import run_spades
+import run_kraken2
+import run_ariba
+import run_genefinder
+import run_phenix
+import run_prokka
+import genefinder_xml2tsv
+
+
+def parse_arguments():
+    parser = ArgumentParser(description = "Benchmark job generation and result compilation with synthetic data")
+    parser.add_argument('--isolates', '-n', dest = 'isolates', type = int, required = False, default = 1000, help = "Number of synthetic isolates (default: 1000)")
+    parser.add_argument('--xml', '-x', dest = 'xml', type = int, required = False, default = 0, help = "Number of GeneFinder XML files (default: 0, same as --isolates)")
+    parser.add_argument('--genes', '-g', dest = 'genes', type = int, required = False, default = 50, help = "Number of gene results per XML file (default: 50)")
+    parser.add_argument('--queue', '-q', dest = 'queue', type = int, required = False, default = 10, help = "Size of each serial job queue (default: 10)")
+    parser.add_argument('--scheduler', '-s', dest = 'scheduler', type = str, required = False, default = 'SGE', help = "Job scheduler (SGE/PBS/Slurm); default: SGE")
+    parser.add_argument('--repeats', '-r', dest = 'repeats', type = int, required = False, default = 3, help = "Number of timed runs per benchmark (default: 3)")
+    parser.add_argument('--workdir', '-w', dest = 'workdir', type = str, required = False, default = '', help = "Directory of synthetic data (default: a temporary directory)")
+    parser.add_argument('--keep', '-k', dest = 'keep', action = 'store_true', help = "Keep synthetic data and job scripts")
+    parser.add_argument('--output', '-o', dest = 'output', type = str, required = False, default = 'benchmark.json', help = "Output JSON file (default: benchmark.json)")
+    parser.add_argument('--baseline', '-b', dest = 'baseline', type = str, required = False, default = '', help = "(Optional) JSON file of a previous run for comparison")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    workdir = args.workdir if args.workdir != '' else tempfile.mkdtemp(prefix = 'benchmark_')
+    pipeline_modules.check_dir(workdir)
+    data = make_data(workdir, args.isolates, args.xml if args.xml > 0 else args.isolates, args.genes)
+    results = list()
+    path = os.environ['PATH']
+    sleep = time.sleep
+    event_log = os.environ.pop('PIPELINE_EVENT_LOG', None)
+    os.environ['PATH'] = data['bin'] + os.pathsep + path
+    time.sleep = lambda s: None
+    try:
+        for name, func, items in benchmarks(data, args.queue, args.scheduler):
+            r = run_benchmark(name, func, items, args.repeats)
+            results.append(r)
+            print(f"{name}\t{r['items']} items\t{r['seconds']:.3f} s\t{r['throughput']:.1f} items/s\t{r['peak_mem_mb']:.1f} MB", file = sys.stderr)
+    finally:
+        os.environ['PATH'] = path
+        time.sleep = sleep
+        if event_log is not None:
+            os.environ['PIPELINE_EVENT_LOG'] = event_log
+        if not args.keep:
+            shutil.rmtree(workdir)
+    report = {'time' : time.strftime('%Y-%m-%d %H:%M:%S'), 'python' : platform.python_version(), 'platform' : platform.platform(),\
+              'parameters' : {'isolates' : args.isolates, 'xml' : args.xml if args.xml > 0 else args.isolates, 'genes' : args.genes,\
+                              'queue' : args.queue, 'scheduler' : args.scheduler, 'repeats' : args.repeats},\
+              'results' : results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent = 2)
+    print(f"Results have been saved in {args.output}.", file = sys.stderr)
+    if args.baseline != '':
+        compare(report, args.baseline)
+    return
+
+
+def make_data(workdir, n, n_xml, n_genes):
+    """ Creates fake reads, assemblies, GeneFinder XML files, sample sheets and stub submission commands under workdir """
+    d = {k : os.path.join(workdir, k) for k in ['reads', 'assemblies', 'xml', 'bin', 'out']}
+    for p in d.values():
+        pipeline_modules.check_dir(p)
+    fastq = b'@r1\nACGTACGTAC\n+\nIIIIIIIIII\n'
+    fasta = b'>contig_1\nACGTACGTACGTACGTACGT\n'
+    with open(os.path.join(workdir, 'readsets.tsv'), 'w') as readsets, open(os.path.join(workdir, 'assemblies.tsv'), 'w') as assemblies:
+        for k in range(n):
+            i = f'isolate_{k}'
+            r = [os.path.join(d['reads'], f'{i}_{j}.fastq.gz') for j in [1, 2]]
+            for f in r:
+                with gzip.open(f, 'wb') as fh:
+                    fh.write(fastq)
+            a = os.path.join(d['assemblies'], f'{i}.fna')
+            with open(a, 'wb') as fh:
+                fh.write(fasta)
+            readsets.write(f'{i}\t{r[0]}\t{r[1]}\n')
+            assemblies.write(f'{i}\t{a}\n')
+    d['xml_files'] = list()
+    for k in range(n_xml):
+        f = os.path.join(d['xml'], f'isolate_{k}.xml')
+        with open(f, 'w') as fh:
+            fh.write(genefinder_xml(f'isolate_{k}', n_genes))
+        d['xml_files'].append(f)
+    for command in ['qsub', 'sbatch']:
+        stub = os.path.join(d['bin'], command)
+        with open(stub, 'w') as fh:
+            fh.write('#!/bin/sh\nexit 0\n')
+        os.chmod(stub, 0o755)
+    d['readsets'] = os.path.join(workdir, 'readsets.tsv')
+    d['assemblies_tsv'] = os.path.join(workdir, 'assemblies.tsv')
+    d['ref'] = os.path.join(workdir, 'ref.fasta')
+    with open(d['ref'], 'wb') as fh:
+        fh.write(fasta)
+    return d
+
+
+def genefinder_xml(sample, n_genes):
+    """ Returns the content of a GeneFinder result XML file in the structure expected by genefinder_xml2tsv.py """
+    results = ['<result type="coverage_control" value="NA"/>', '<result type="mix_indicator" value="NA"/>']
+    for g in range(n_genes):
+        values = {'detection' : 'ND' if g % 5 == 4 else 'DETECTED', 'description' : f'gene {g}', 'report_type' : 'AMR_1', 'mode' : 'gene',\
+                  'coverage' : '100', 'homology' : '99.5', 'depth' : '35', 'coverage_distribution' : '1', 'alterations' : 'NA',\
+                  'insertions' : '0', 'deletions' : '0', 'mix' : 'NA', 'large_indels' : 'NA', 'mismatch' : '1'}
+        fields = ''.join(f'<result_data type="{t}" value="{v}"/>' for t, v in values.items())
+        results.append(f'<result type="gene" value="gene{g}_{g}">{fields}</result>')
+    return f'<ngs_sample id="{sample}_1"><workflow/><results>{"".join(results)}</results></ngs_sample>\n'
+
+
+def benchmarks(data, queue, scheduler):
+    """ Returns a list of (name, function, number of items) """
+    out = data['out']
+    readsets = lambda: quiet(lambda: pipeline_modules.import_readsets(data['readsets']))
+    assemblies = lambda: quiet(lambda: pipeline_modules.import_assemblies(data['assemblies_tsv']))
+    mains = {'spades' : (run_spades, ['-r', data['readsets']]),\
+             'kraken2' : (run_kraken2, ['-r', data['readsets'], '-b', 'db']),\
+             'ariba' : (run_ariba, ['-r', data['readsets'], '-b', 'db', '-e', 'ariba']),\
+             'genefinder' : (run_genefinder, ['-r', data['readsets'], '-b', 'db']),\
+             'phenix' : (run_phenix, ['-r', data['readsets'], '-e', data['ref']]),\
+             'prokka' : (run_prokka, ['-a', data['assemblies_tsv'], '-c', 'prokka', '-g', 'Escherichia', '-sp', 'coli', '-p', 'proteins.faa'])}
+    tools = {'spades' : lambda a: run_spades.SPAdes(a), 'kraken2' : lambda a: run_kraken2.Kraken2(a), 'ariba' : lambda a: run_ariba.ARIBA(a),\
+             'genefinder' : lambda a: run_genefinder.GeneFinder(a), 'phenix' : lambda a: run_phenix.PHEnix(a, out, '--json', f"ref={data['ref']}"),\
+             'prokka' : lambda a: run_prokka.Prokka(a)}
+    readsets_dict = readsets()
+    assemblies_dict = assemblies()
+    n = len(readsets_dict)
+    tasks = [('import_readsets', readsets, n), ('import_assemblies', assemblies, n)]
+    for tool, (module, argv) in mains.items():
+        plugin = tools[tool](parse_args(module, argv + ['-o', out, '-s', scheduler]))
+        samples = assemblies_dict if tool == 'prokka' else readsets_dict
+        tasks.append((f'{tool}.create_job_script', lambda plugin = plugin, samples = samples: create_in_queues(plugin, samples, queue, scheduler), n))
+    for tool, (module, argv) in mains.items():
+        tool_out = os.path.join(out, tool)
+        argv = argv + ['-o', tool_out, '-q', str(queue), '-s', scheduler]
+        tasks.append((f'{tool}.main', lambda module = module, argv = argv, tool_out = tool_out: run_main(module, argv, tool_out), n))
+    tasks.append(('genefinder_xml2tsv.main', lambda: run_main(genefinder_xml2tsv, ['-i'] + data['xml_files']), len(data['xml_files'])))
+    return tasks
+
+
+def create_in_queues(tool, samples, queue, scheduler):
+    """ Generates job scripts in memory for samples in queues of the given size """
+    ids = list(samples.keys())
+    for k in range(0, len(ids), queue):
+        pipeline_modules.create_job_script(tool, {i : samples[i] for i in ids[k : k + queue]}, scheduler)
+    return
+
+
+def run_main(module, argv, outdir = None):
+    """ Runs the main function of a script with command-line arguments argv """
+    if outdir is not None and os.path.exists(outdir):
+        shutil.rmtree(outdir)  # Every run starts from an empty output directory.
+    sys_argv = sys.argv
+    sys.argv = [module.__name__ + '.py'] + argv
+    try:
+        quiet(module.main)
+    finally:
+        sys.argv = sys_argv
+    return
+
+
+def parse_args(module, argv):
+    """ Parses command-line arguments argv with the argument parser of a script """
+    sys_argv = sys.argv
+    sys.argv = [module.__name__ + '.py'] + argv
+    try:
+        return module.parse_arguments()
+    finally:
+        sys.argv = sys_argv
+
+
+def quiet(func):
+    """ Runs a function with stdout and stderr discarded """
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        return func()
+
+
+def run_benchmark(name, func, items, repeats):
+    seconds = list()
+    for _ in range(max(1, repeats)):
+        t = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - t)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    s = min(seconds)
+    return {'name' : name, 'items' : items, 'seconds' : s, 'throughput' : items / s if s > 0 else 0.0, 'peak_mem_mb' : peak / 1048576}
+
+
+def compare(report, baseline):
+    """ Prints time and memory ratios of the current run to a previous run """
+    if not os.path.exists(baseline):
+        print(f"Warning: baseline file {baseline} is not accessible.", file = sys.stderr)
+        return
+    with open(baseline, 'r') as f:
+        previous = {r['name'] : r for r in json.load(f)['results']}
+    print('\t'.join(['Benchmark', 'Time_ratio', 'Memory_ratio']), file = sys.stdout)
+    for r in report['results']:
+        p = previous.get(r['name'])
+        if p is None:
+            continue
+        t = r['seconds'] / p['seconds'] if p['seconds'] > 0 else float('nan')
+        m = r['peak_mem_mb'] / p['peak_mem_mb'] if p['peak_mem_mb'] > 0 else float('nan')
+        print(f"{r['name']}\t{t:.3f}\t{m:.3f}", file = sys.stdout)
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+Pack per-isolate output directories (for example, SPAdes, ARIBA and GeneFinder work directories) into one indexed
+archive per isolate, optionally deleting the directories, and read single members of archives without extraction.
+
+Example commands:
+    python pack_outputs.py pack -i spades/*/ -o spades/archives -n 8 --delete
+    python pack_outputs.py list -a spades/archives/isolate_1.zip
+    python pack_outputs.py cat -a spades/archives/isolate_1.zip -m spades.log > isolate_1.log
+
+Python API:
+    from pack_outputs import list_members, read_member, open_member, read_link
+    log = read_member('spades/archives/isolate_1.zip', 'spades.log').decode()
+
+Notes:
+    1. Dependencies: Python >= 3.7.
+    2. Archives are ZIP files ({isolate}.zip, where the isolate name is the directory name), whose central directory
+       indexes members for random access. Members are compressed individually, so reading a member only decompresses
+       itself. Files that are already compressed (such as .gz and .bam files) are stored without compression.
+    3. --compression zstd requires a Python whose zipfile module supports Zstandard (Python >= 3.14). Otherwise,
+       deflate (the default), bzip2 or lzma can be used.
+    4. A directory is only deleted after its archive has been written, renamed into place and verified against the
+       sizes and CRC-32 checksums of its members. Symbolic links in directories are packed as link members, whose
+       content is the link target (see read_link), and are not followed. Empty subdirectories are packed as directory
+       members ({name}/).
+    5. Symbolic links to packed directories (for example, aliases of duplicate read sets created by run_ariba.py), in
+       the input or beside the packed directories, become links {alias}.zip -> {isolate}.zip in the output directory
+       and are removed with --delete, so that they do not dangle. Other inputs that are symbolic links are skipped.
+    6. Isolates are packed in parallel in a process pool.
+
+Copyright (C) 2026 Yu Wan <wanyuac@126.com>
+Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
+First version: 19 Oct 2026; the latest update: 19 Oct 2026
+"""
+
+import os
+import sys
+import stat
+import shutil
+import zipfile
+from multiprocessing import Pool
+from argparse import ArgumentParser
+from pipeline_modules import check_dir
+
+COMPRESSIONS = {'deflate' : zipfile.ZIP_DEFLATED, 'bzip2' : zipfile.ZIP_BZIP2, 'lzma' : zipfile.ZIP_LZMA, 'store' : zipfile.ZIP_STORED}
+if hasattr(zipfile, 'ZIP_ZSTANDARD'):  # Python >= 3.14
+    COMPRESSIONS['zstd'] = zipfile.ZIP_ZSTANDARD
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz', '.zst', '.zip', '.bam', '.cram', '.bgz')  # Files stored without compression
+
+
+def parse_arguments():
+    parser = ArgumentParser(description = "Pack per-isolate output directories into indexed archives and read their members")
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+    p = subparsers.add_parser('pack', help = "Pack directories into one archive per isolate")
+    p.add_argument('-i', '--input', dest = 'input', nargs = '+', type = str, required = True, help = "Per-isolate output directories, named after isolates")
+    p.add_argument('-o', '--outdir', dest = 'outdir', type = str, required = False, default = 'archives', help = "Output directory of archives (default: archives)")
+    p.add_argument('-c', '--compression', dest = 'compression', type = str, required = False, default = 'deflate', help = "Compression method: %s (default: deflate)" % '/'.join(COMPRESSIONS.keys()))
+    p.add_argument('-l', '--level', dest = 'level', type = int, required = False, default = None, help = "(Optional) Compression level")
+    p.add_argument('-n', '--ncpus', dest = 'ncpus', type = int, required = False, default = 1, help = "Number of processes (default: 1)")
+    p.add_argument('-d', '--delete', dest = 'delete', action = 'store_true', help = "Delete directories after their archives are verified")
+    p.add_argument('-u', '--resume', dest = 'resume', action = 'store_true', help = "Skip isolates whose archives exist")
+    p = subparsers.add_parser('list', help = "List members of an archive")
+    p.add_argument('-a', '--archive', dest = 'archive', type = str, required = True, help = "An archive")
+    p = subparsers.add_parser('cat', help = "Write a member of an archive to stdout")
+    p.add_argument('-a', '--archive', dest = 'archive', type = str, required = True, help = "An archive")
+    p.add_argument('-m', '--member', dest = 'member', type = str, required = True, help = "Path of the member relative to the isolate's directory")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.command == 'list':
+        print('\t'.join(['Member', 'Size', 'Compressed_size', 'Link_target']), file = sys.stdout)
+        with zipfile.ZipFile(args.archive, 'r') as z:
+            for m in z.infolist():
+                target = z.read(m).decode() if is_link(m) else ''
+                print(f"{m.filename}\t{m.file_size}\t{m.compress_size}\t{target}", file = sys.stdout)
+    elif args.command == 'cat':
+        try:
+            with open_member(args.archive, args.member) as f:
+                shutil.copyfileobj(f, sys.stdout.buffer)
+        except KeyError:
+            print(f"Error: member {args.member} is not found in {args.archive}.", file = sys.stderr)
+            sys.exit(1)
+    else:
+        if args.compression not in COMPRESSIONS:
+            print(f"Error: compression method {args.compression} is not supported by this Python. Choose one of: {'/'.join(COMPRESSIONS.keys())}.", file = sys.stderr)
+            sys.exit(1)
+        dirs = list()
+        for d in args.input:
+            d = d.rstrip('/')
+            if os.path.isdir(d) and not os.path.islink(d):
+                dirs.append(d)
+            elif not os.path.islink(d):
+                print(f"Warning: input {d} is skipped as it is not a directory.", file = sys.stderr)
+        if len(set(os.path.basename(d) for d in dirs)) < len(dirs):
+            print("Error: isolate names derived from directory names are not unique.", file = sys.stderr)
+            sys.exit(1)
+        check_dir(args.outdir)
+        tasks = [(d, os.path.join(args.outdir, os.path.basename(d) + '.zip'), args.compression, args.level, args.delete, args.resume) for d in dirs]
+        links = [d.rstrip('/') for d in args.input if os.path.islink(d.rstrip('/'))]
+        aliases = find_aliases(dirs, links)
+        n_files, n_skipped = 0, 0
+        with Pool(args.ncpus) as pool:
+            try:
+                for d, n, packed in pool.imap_unordered(pack_directory, tasks):
+                    n_files += n if packed else 0
+                    n_skipped += not packed
+                    for a in aliases.get(d, []):  # Aliases of d become aliases of its archive.
+                        link = os.path.join(args.outdir, os.path.basename(a) + '.zip')
+                        if os.path.lexists(link):
+                            os.remove(link)
+                        os.symlink(os.path.basename(d) + '.zip', link)
+                        if args.delete:
+                            os.remove(a)
+            except IOError as e:  # Raised by worker processes
+                print(f"Error: {e}", file = sys.stderr)
+                sys.exit(1)
+        packed_links = set(a for v in aliases.values() for a in v)
+        for a in [a for a in links if a not in packed_links]:
+            print(f"Warning: input {a} is skipped as it is a symbolic link to a directory that is not packed.", file = sys.stderr)
+        print(f"{n_files} files of {len(tasks) - n_skipped} directories have been packed into {args.outdir}.", file = sys.stderr)
+        if n_skipped > 0:
+            print(f"{n_skipped} directories are skipped as their archives exist{' and have been verified' if args.delete else ''}.", file = sys.stderr)
+    return
+
+
+def find_aliases(dirs, links):
+    """
+    Returns a dictionary {directory : [symbolic links]} of symbolic links that point to the directories to be packed,
+    searched in 'links' and in parent directories of the directories.
+    """
+    real = {os.path.realpath(d) : d for d in dirs}
+    candidates = set(links)
+    for parent in set(os.path.dirname(d) or '.' for d in dirs):
+        candidates.update(os.path.join(parent, e.name) for e in os.scandir(parent) if e.is_symlink())
+    aliases = dict()
+    for a in sorted(candidates):
+        target = os.path.realpath(a)
+        if target in real and os.path.basename(a) != os.path.basename(real[target]):
+            aliases.setdefault(real[target], []).append(a)
+    return aliases
+
+
+def directory_members(d):
+    """
+    Returns a list of (path, member name) of files, symbolic links and empty subdirectories under a directory. Member
+    names of empty subdirectories end with '/'.
+    """
+    members = list()
+    for root, subdirs, names in os.walk(d):  # Symbolic links to directories are listed in subdirs but not followed.
+        subdirs.sort()
+        links = sorted(s for s in subdirs if os.path.islink(os.path.join(root, s)))
+        if root != d and len(names) == 0 and len(subdirs) == 0:
+            members.append((root, os.path.relpath(root, d) + '/'))
+        for name in sorted(names) + links:
+            path = os.path.join(root, name)
+            members.append((path, os.path.relpath(path, d)))
+    return members
+
+
+def member_size(path, member):
+    """ Returns the size of a member in an archive: the length of the target of a link, 0 of a directory or the file size """
+    if os.path.islink(path):
+        return len(os.readlink(path).encode())
+    return 0 if member.endswith('/') else os.path.getsize(path)
+
+
+def pack_directory(task):
+    """
+    Packs files, symbolic links and empty subdirectories under a directory into a ZIP archive, verifies the archive and
+    deletes the directory if required. With resume = True, an existing archive is not rewritten but still verified
+    before the directory is deleted. Returns the directory, the number of members and whether the directory is packed.
+    """
+    d, archive, compression, level, delete, resume = task
+    method = COMPRESSIONS[compression]
+    members = directory_members(d)
+    packed = not (resume and os.path.exists(archive))
+    if packed:
+        tmp = archive + '.tmp'
+        with zipfile.ZipFile(tmp, 'w', compression = method, compresslevel = level, allowZip64 = True) as z:
+            for path, member in members:
+                if os.path.islink(path):
+                    info = zipfile.ZipInfo(member)
+                    info.external_attr = (stat.S_IFLNK | 0o777) << 16  # The Unix mode of a symbolic link, as stored by Info-ZIP
+                    z.writestr(info, os.readlink(path).encode(), compress_type = zipfile.ZIP_STORED)
+                elif member.endswith('/'):
+                    info = zipfile.ZipInfo(member)
+                    info.external_attr = ((stat.S_IFDIR | 0o755) << 16) | 0x10  # Unix and MS-DOS attributes of a directory
+                    z.writestr(info, b'', compress_type = zipfile.ZIP_STORED)
+                else:
+                    z.write(path, member, compress_type = zipfile.ZIP_STORED if member.endswith(COMPRESSED_EXTENSIONS) else method)
+        os.replace(tmp, archive)
+    if delete:
+        files = {member : member_size(path, member) for path, member in members}
+        with zipfile.ZipFile(archive, 'r') as z:
+            sizes = {m.filename : m.file_size for m in z.infolist()}
+            bad = z.testzip()  # Checks CRC-32 checksums of all members
+        if bad is not None or sizes != files:
+            raise IOError(f"Archive {archive} does not match directory {d}, which is therefore kept.")
+        shutil.rmtree(d)
+    return d, len(members), packed
+
+
+def open_member(archive, member):
+    """
+    Returns a binary file object of a member in an archive, which is decompressed while being read. Raises KeyError
+    if the member does not exist.
+    """
+    z = zipfile.ZipFile(archive, 'r')
+    try:
+        f = z.open(member, 'r')
+    except KeyError:
+        z.close()
+        raise
+    z.close()  # The member remains readable as ZipExtFile holds its own reference to the archive.
+    return f
+
+
+def is_link(info):
+    """ Tests whether a member (a ZipInfo object) is a symbolic link """
+    return stat.S_ISLNK(info.external_attr >> 16)
+
+
+def read_link(archive, member):
+    """ Returns the target of a member that is a symbolic link, or None if the member is not a link """
+    with zipfile.ZipFile(archive, 'r') as z:
+        info = z.getinfo(member)
+        return z.read(info).decode() if is_link(info) else None
+
+
+def read_member(archive, member):
+    """ Returns the content of a member in an archive as bytes """
+    with zipfile.ZipFile(archive, 'r') as z:
+        return z.read(member)
+
+
+def list_members(archive):
+    """ Returns names of members in an archive """
+    with zipfile.ZipFile(archive, 'r') as z:
+        return z.namelist()
+
+
+if __name__ == '__main__':
+    main()
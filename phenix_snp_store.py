@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""
+Maintain a persisted store of SNP genotypes and pairwise SNP distances for PHEnix VCF files, so that distances are
+only computed for newly added isolates.
+
+Example commands:
+    python phenix_snp_store.py create -s cohort_store -n 8 -i output/vcf/*.filtered.vcf
+    python phenix_snp_store.py add -s cohort_store -n 8 -i new_output/vcf/*.filtered.vcf
+    python phenix_snp_store.py query -s cohort_store -i isolate_1 -t 10 > neighbours.tsv
+
+Store files:
+    sites.tsv: the site index (chromosome, position and reference base of each variable position), fixed at creation;
+    isolates.txt: isolate names in the order of rows. This file is updated last and defines the size of the store;
+    genotypes.u8: a row-major uint8 genotype matrix (isolates x sites; A/C/G/T/N encoded as 0-4);
+    distances.u32: a packed lower triangle of the distance matrix in uint32. Row i stores distances from isolate i to
+                   isolates 0, ..., i - 1, so the file grows by appending rows;
+    .lock: a lock file serialising updates of the store.
+
+Notes:
+    1. Dependencies: Python >= 3.6, NumPy, phenix_vcf2aln.py.
+    2. Adding k isolates to a store of n isolates only computes k x (n + k) distances.
+    3. New isolates are genotyped at the existing site index. Substitutions at positions that are not variable in the
+       store are ignored and counted in a warning. Recreate the store when these counts become large.
+    4. Updates (create and add) hold an exclusive lock on the store and remove rows left by an interrupted update before
+       appending new rows. Queries never modify the store: they size the matrices from complete lines of isolates.txt,
+       so rows being appended by a concurrent update are not read.
+
+Copyright (C) 2026 Yu Wan <wanyuac@126.com>
+Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
+First version: 19 Oct 2026; the latest update: 19 Oct 2026
+"""
+
+import os
+import sys
+import fcntl
+import numpy as np
+from multiprocessing import Pool
+from argparse import ArgumentParser
+from pipeline_modules import check_dir
+from phenix_vcf2aln import BASES, isolate_name, parse_snp_sites, collect_sites, init_worker, parse_genotypes,\
+    snp_distances, write_sites
+
+
+def parse_arguments():
+    parser = ArgumentParser(description = "Create, update and query a store of SNP genotypes and distances")
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+    for command, description in [('create', "Create a store from VCF files"), ('add', "Add VCF files of new isolates to a store")]:
+        p = subparsers.add_parser(command, help = description)
+        p.add_argument('-s', '--store', dest = 'store', type = str, required = True, help = "Directory of the store")
+        p.add_argument('-i', '--input', dest = 'input', nargs = '+', type = str, required = True, help = "Input VCF files (can be gzip-compressed)")
+        p.add_argument('-n', '--ncpus', dest = 'ncpus', type = int, required = False, default = 1, help = "Number of processes for parsing VCFs (default: 1)")
+        if command == 'create':
+            p.add_argument('-f', '--force', dest = 'force', action = 'store_true', help = "Overwrite an existing store that has isolates")
+    p = subparsers.add_parser('query', help = "Print neighbours of isolates within a SNP threshold")
+    p.add_argument('-s', '--store', dest = 'store', type = str, required = True, help = "Directory of the store")
+    p.add_argument('-i', '--isolates', dest = 'isolates', nargs = '+', type = str, required = True, help = "Names of query isolates")
+    p.add_argument('-t', '--threshold', dest = 'threshold', type = int, required = False, default = None, help = "Maximum SNP distance of neighbours (default: no limit)")
+    p.add_argument('-k', '--top', dest = 'top', type = int, required = False, default = 0, help = "Maximum number of neighbours per isolate (default: 0, no limit)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.command == 'query':
+        store = SNPStore(args.store)
+        print('\t'.join(['Isolate', 'Neighbour', 'Distance']), file = sys.stdout)
+        for i in args.isolates:
+            if i not in store.index:
+                print(f"Warning: isolate {i} is not found in the store.", file = sys.stderr)
+                continue
+            for j, d in store.neighbours(i, args.threshold, args.top):
+                print(f"{i}\t{j}\t{d}", file = sys.stdout)
+    else:
+        vcfs = [v for v in args.input if os.path.exists(v)]
+        for v in set(args.input) - set(vcfs):
+            print(f"Warning: VCF file {v} is ignored as it is not accessible.", file = sys.stderr)
+        if len(vcfs) == 0:
+            print("Error: no VCF file was found. Exit.", file = sys.stderr)
+            sys.exit(1)
+        if args.command == 'create':
+            store = SNPStore.create(args.store, vcfs, args.ncpus, args.force)
+        else:
+            store = SNPStore(args.store)
+            store.add(vcfs, args.ncpus)
+        print(f"The store has {store.n} isolates and {store.m} variable positions.", file = sys.stderr)
+    return
+
+
+class SNPStore:
+    """ A directory of SNP genotypes and distances that grows by appending rows """
+
+    def __init__(self, store):
+        self.store = store
+        self.isolates_file = os.path.join(store, 'isolates.txt')
+        self.genotypes_file = os.path.join(store, 'genotypes.u8')
+        self.distances_file = os.path.join(store, 'distances.u32')
+        self.lock_file = os.path.join(store, '.lock')
+        if not os.path.exists(self.isolates_file):
+            print(f"Error: {store} is not a SNP store.", file = sys.stderr)
+            sys.exit(1)
+        self.sites = read_sites(os.path.join(store, 'sites.tsv'))
+        self.m = len(self.sites[0])
+        self.__load()
+        return
+
+    @classmethod
+    def create(cls, store, vcfs, ncpus, force = False):
+        """
+        Creates a store from VCF files, whose variable positions define the site index. An existing store that has
+        isolates is only overwritten when force = True.
+        """
+        isolates_file = os.path.join(store, 'isolates.txt')
+        if not force and os.path.exists(isolates_file) and os.path.getsize(isolates_file) > 0:
+            print(f"Error: {store} is an existing store of isolates. Use command 'add' to add isolates, or --force to overwrite it.", file = sys.stderr)
+            sys.exit(1)
+        check_dir(store)
+        with Pool(ncpus) as pool:
+            sites = collect_sites(pool.imap(parse_snp_sites, vcfs, chunksize = 8))
+        with open(os.path.join(store, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            write_sites(sites, os.path.join(store, 'sites.tsv'))
+            for f in ['genotypes.u8', 'distances.u32', 'isolates.txt']:
+                open(os.path.join(store, f), 'w').close()
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        s = cls(store)
+        s.add(vcfs, ncpus)
+        return s
+
+    def __load(self):
+        """ Reads isolate names from complete lines of isolates.txt and checks that matrices hold their rows """
+        with open(self.isolates_file, 'r') as f:
+            lines = f.read().split('\n')[ : -1]  # The last element is empty or a line being written.
+        self.isolates = [i for i in lines if i != '']
+        self.n = len(self.isolates)
+        self.index = {i : k for k, i in enumerate(self.isolates)}
+        for f, size in self.__sizes():
+            if os.path.getsize(f) < size:
+                print(f"Error: {f} is shorter than expected from {self.isolates_file}.", file = sys.stderr)
+                sys.exit(1)
+        return
+
+    def __sizes(self):
+        """ Returns expected sizes (bytes) of the matrix files """
+        return [(self.genotypes_file, self.n * self.m), (self.distances_file, self.n * (self.n - 1) // 2 * 4)]
+
+    def __truncate(self):
+        """
+        Removes rows of an interrupted update, which were written before isolates.txt, and a partial name at the end of
+        isolates.txt. Only called under the lock.
+        """
+        with open(self.isolates_file, 'rb') as f:
+            size = f.read().rfind(b'\n') + 1  # The end of the last complete line
+        if os.path.getsize(self.isolates_file) > size:
+            print(f"Warning: a partial isolate name of an interrupted update is removed from {self.isolates_file}.", file = sys.stderr)
+            os.truncate(self.isolates_file, size)
+        for f, size in self.__sizes():
+            if os.path.getsize(f) > size:
+                print(f"Warning: incomplete rows of an interrupted update are removed from {f}.", file = sys.stderr)
+                os.truncate(f, size)
+        return
+
+    def genotypes(self):
+        if self.n == 0 or self.m == 0:
+            return np.zeros((self.n, self.m), dtype = np.uint8)
+        return np.memmap(self.genotypes_file, dtype = np.uint8, mode = 'r', shape = (self.n, self.m))
+
+    def distances(self):
+        if self.n < 2:
+            return np.zeros(0, dtype = np.uint32)
+        return np.memmap(self.distances_file, dtype = np.uint32, mode = 'r', shape = (self.n * (self.n - 1) // 2,))
+
+    def add(self, vcfs, ncpus):
+        """ Genotypes new isolates at the site index and appends their genotypes and distances to the store """
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.__load()  # Isolates may have been added by another process since the store was opened.
+            self.__truncate()
+            self.__append(vcfs, ncpus)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        return
+
+    def __append(self, vcfs, ncpus):
+        """ Appends rows of new isolates to the store. Only called under the lock. """
+        isolates = [isolate_name(v) for v in vcfs]
+        new = [(i, v) for i, v in zip(isolates, vcfs) if i not in self.index]
+        for i in set(isolates) - set(i for i, _ in new):
+            print(f"Warning: isolate {i} is ignored as it is already in the store.", file = sys.stderr)
+        if len(set(i for i, _ in new)) < len(new):
+            print("Error: isolate names derived from VCF filenames are not unique.", file = sys.stderr)
+            sys.exit(1)
+        if len(new) == 0:
+            return
+        k = len(new)
+        rows = np.zeros((k, self.m), dtype = np.uint8)
+        with Pool(ncpus, initializer = init_worker, initargs = (self.sites,)) as pool:
+            for t, (row, novel) in enumerate(pool.imap(parse_genotypes, [v for _, v in new], chunksize = 8)):
+                rows[t] = row
+                if novel > 0:
+                    print(f"Warning: {novel} substitution(s) of isolate {new[t][0]} are outside the site index.", file = sys.stderr)
+
+        # Only distances from new isolates to existing and other new isolates are computed.
+        d_old = snp_distances(rows, self.genotypes())
+        d_new = snp_distances(rows, rows)
+        with open(self.genotypes_file, 'ab') as f:
+            f.write(rows.tobytes())
+        with open(self.distances_file, 'ab') as f:
+            for t in range(k):
+                f.write(d_old[t].astype(np.uint32).tobytes() + d_new[t, : t].astype(np.uint32).tobytes())
+        with open(self.isolates_file, 'a') as f:
+            f.write(''.join(i + '\n' for i, _ in new))
+        for i, _ in new:
+            self.index[i] = self.n
+            self.isolates.append(i)
+            self.n += 1
+        print(f"{k} isolate(s) have/has been added to the store.", file = sys.stderr)
+        return
+
+    def row(self, i):
+        """ Returns SNP distances from isolate i to all isolates in the store (including itself) """
+        r = self.index[i]
+        j = np.arange(self.n, dtype = np.int64)
+        offsets = np.where(j < r, r * (r - 1) // 2 + j, j * (j - 1) // 2 + r)  # Lower-triangle offsets of (r, j) or (j, r)
+        offsets[r] = 0
+        d = np.asarray(self.distances()[offsets], dtype = np.int64) if self.n > 1 else np.zeros(self.n, dtype = np.int64)
+        d[r] = 0
+        return d
+
+    def neighbours(self, i, threshold = None, top = 0):
+        """ Returns a list of (isolate, distance) sorted by distances, excluding isolate i itself """
+        d = self.row(i)
+        j = np.argsort(d, kind = 'stable')
+        j = j[j != self.index[i]]
+        if threshold is not None:
+            j = j[d[j] <= threshold]
+        if top > 0:
+            j = j[ : top]
+        return [(self.isolates[x], int(d[x])) for x in j]
+
+
+def read_sites(tsv):
+    """ Reads a site index written by phenix_vcf2aln.write_sites """
+    chroms, positions, refs = [], [], []
+    with open(tsv, 'r') as f:
+        f.readline()  # Skip the header line
+        for line in f:
+            if line.strip() == '':
+                continue
+            chrom, pos, ref = line.rstrip('\n').split('\t')
+            chroms.append(chrom)
+            positions.append(int(pos))
+            refs.append(BASES.index(ref.encode()))
+    return np.array(chroms, dtype = object), np.array(positions, dtype = np.int64), np.array(refs, dtype = np.uint8)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""
+Build a core-genome SNP alignment and a pairwise SNP-distance matrix from PHEnix's filtered VCF files.
+
+Example command:
+    python phenix_vcf2aln.py -i output/vcf/*.filtered.vcf -o snps -n 8
+
+Output files (under --outdir):
+    alignment.fasta: multi-FASTA alignment of variable positions;
+    sites.tsv: chromosome, position and reference base of each column of the alignment;
+    isolates.txt: isolate names in the order of rows of the genotype matrix;
+    genotypes.npy: a memory-mapped uint8 genotype matrix (isolates x variable positions), where A/C/G/T/N are encoded as 0-4;
+    distances.tsv: pairwise SNP distances.
+
+Notes:
+    1. Dependencies: Python >= 3.6, NumPy.
+    2. Variable positions are PASS sites of single-base substitutions in any VCF. Positions failing the quality filters
+       of run_phenix.py (argument --filters) are labelled in the FILTER column by PHEnix and are masked as 'N'.
+    3. VCFs are parsed twice in a process pool: first to collect variable positions, then to fill the genotype matrix
+       on disk. Hence neither the VCFs nor the genotype matrix are held in memory as a whole.
+    4. Distances only count positions called in both isolates of each pair.
+
+Copyright (C) 2026 Yu Wan <wanyuac@126.com>
+Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
+First version: 19 Oct 2026; the latest update: 19 Oct 2026
+"""
+
+import os
+import sys
+import gzip
+import numpy as np
+from multiprocessing import Pool
+from argparse import ArgumentParser
+from pipeline_modules import check_dir
+
+BASES = b'ACGTN'
+N_CODE = 4  # Genotype code of masked or ambiguous calls
+BASE_CODES = {b : i for i, b in enumerate('ACGT')}
+CHUNK_BYTES = 1 << 26  # Size of working arrays (bytes) per column chunk in distance calculation
+
+site_index = None  # A per-process tuple of the site index (see build_site_index) and reference base codes, set by init_worker
+
+
+def parse_arguments():
+    parser = ArgumentParser(description = "Build a SNP alignment and a SNP-distance matrix from PHEnix VCF files")
+    parser.add_argument('-i', '--input', dest = 'input', nargs = '+', type = str, required = True, help = "Input VCF files (can be gzip-compressed)")
+    parser.add_argument('-o', '--outdir', dest = 'outdir', type = str, required = False, default = 'snps', help = "Output directory (default: snps)")
+    parser.add_argument('-n', '--ncpus', dest = 'ncpus', type = int, required = False, default = 1, help = "Number of processes for parsing VCFs (default: 1)")
+    parser.add_argument('-r', '--with_ref', dest = 'with_ref', action = 'store_true', help = "Add the reference sequence to the alignment")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    vcfs = [v for v in args.input if os.path.exists(v)]
+    for v in set(args.input) - set(vcfs):
+        print(f"Warning: VCF file {v} is ignored as it is not accessible.", file = sys.stderr)
+    if len(vcfs) == 0:
+        print("Error: no VCF file was found. Exit.", file = sys.stderr)
+        sys.exit(1)
+    isolates = [isolate_name(v) for v in vcfs]
+    if len(set(isolates)) < len(isolates):
+        print("Error: isolate names derived from VCF filenames are not unique.", file = sys.stderr)
+        sys.exit(1)
+    check_dir(args.outdir)
+
+    # Collect variable positions and build the genotype matrix
+    with Pool(args.ncpus) as pool:
+        sites = collect_sites(pool.imap(parse_snp_sites, vcfs, chunksize = 8))
+    m = len(sites[0])
+    print(f"{m} variable positions were found in {len(vcfs)} VCF files.", file = sys.stderr)
+    genotypes = np.lib.format.open_memmap(os.path.join(args.outdir, 'genotypes.npy'), mode = 'w+', dtype = np.uint8, shape = (len(vcfs), m))
+    with Pool(args.ncpus, initializer = init_worker, initargs = (sites,)) as pool:
+        for i, (row, _) in enumerate(pool.imap(parse_genotypes, vcfs, chunksize = 8)):
+            genotypes[i] = row
+    genotypes.flush()
+
+    # Write output files
+    write_sites(sites, os.path.join(args.outdir, 'sites.tsv'))
+    with open(os.path.join(args.outdir, 'isolates.txt'), 'w') as f:
+        f.write('\n'.join(isolates) + '\n')
+    write_alignment(genotypes, isolates, os.path.join(args.outdir, 'alignment.fasta'), sites[2] if args.with_ref else None)
+    write_distances(snp_distances(genotypes, genotypes), isolates, os.path.join(args.outdir, 'distances.tsv'))
+    return
+
+
+def isolate_name(vcf):
+    """ Derives an isolate name from a VCF filename (PHEnix names its output files {sample}.filtered.vcf) """
+    name = os.path.basename(vcf)
+    for suffix in ['.gz', '.vcf', '.filtered']:
+        if name.endswith(suffix):
+            name = name[ : len(name) - len(suffix)]
+    return name
+
+
+def read_vcf(vcf):
+    """ A generator of (chrom, pos, ref, alt, filter) of each VCF record """
+    f = gzip.open(vcf, 'rt') if vcf.endswith('.gz') else open(vcf, 'r')
+    with f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            fields = line.split('\t', 7)
+            if len(fields) < 7:
+                continue
+            yield fields[0], int(fields[1]), fields[3], fields[4], fields[6]
+
+
+def parse_snp_sites(vcf):
+    """
+    Returns a dictionary {chrom : (positions, reference base codes)} of PASS single-base substitutions in a VCF file.
+    """
+    snps = dict()
+    for chrom, pos, ref, alt, filt in read_vcf(vcf):
+        if filt == 'PASS' and alt in BASE_CODES and ref in BASE_CODES:
+            snps.setdefault(chrom, ([], []))
+            snps[chrom][0].append(pos)
+            snps[chrom][1].append(BASE_CODES[ref])
+    return {chrom : (np.array(p, dtype = np.int64), np.array(r, dtype = np.uint8)) for chrom, (p, r) in snps.items()}
+
+
+def collect_sites(site_sets):
+    """
+    Merges outputs of parse_snp_sites into a site index: a tuple of three arrays (chromosomes, positions, reference base
+    codes) sorted by chromosome names and positions.
+    """
+    merged = dict()
+    for snps in site_sets:
+        for chrom, (p, r) in snps.items():
+            merged.setdefault(chrom, ([], []))
+            merged[chrom][0].append(p)
+            merged[chrom][1].append(r)
+    chroms, positions, refs = [], [], []
+    for chrom in sorted(merged.keys()):
+        p = np.concatenate(merged[chrom][0])
+        r = np.concatenate(merged[chrom][1])
+        p, i = np.unique(p, return_index = True)  # Sorted positions and the first reference base at each position
+        chroms.extend([chrom] * len(p))
+        positions.append(p)
+        refs.append(r[i])
+    if len(positions) == 0:
+        return np.array([], dtype = object), np.array([], dtype = np.int64), np.array([], dtype = np.uint8)
+    return np.array(chroms, dtype = object), np.concatenate(positions), np.concatenate(refs)
+
+
+def build_site_index(sites):
+    """ Returns a dictionary {chrom : (sorted positions, column offset)} for looking up columns of the genotype matrix """
+    chroms, positions, _ = sites
+    index = dict()
+    start = 0
+    for end in range(1, len(chroms) + 1):
+        if end == len(chroms) or chroms[end] != chroms[start]:
+            index[chroms[start]] = (positions[start : end], start)
+            start = end
+    return index
+
+
+def init_worker(sites):
+    global site_index
+    site_index = (build_site_index(sites), sites[2])
+    return
+
+
+def parse_genotypes(vcf):
+    """
+    Returns a row of the genotype matrix for a VCF file and the number of PASS substitutions outside variable positions
+    of the site index. Must be called after init_worker.
+    """
+    index, refs = site_index
+    row = refs.copy()  # Isolates carry reference bases unless a variant or a filtered call is found.
+    calls = dict()
+    novel = 0
+    for chrom, pos, ref, alt, filt in read_vcf(vcf):
+        if chrom not in index:
+            if filt == 'PASS' and alt in BASE_CODES:
+                novel += 1
+            continue
+        if filt == 'PASS':
+            if alt in BASE_CODES:
+                code = BASE_CODES[alt]
+            elif alt == '.':
+                continue
+            else:
+                code = N_CODE  # Multi-allelic or ambiguous calls
+        else:
+            code = N_CODE
+        calls.setdefault(chrom, ([], []))
+        calls[chrom][0].append(pos)
+        calls[chrom][1].append(code)
+    for chrom, (p, c) in calls.items():
+        sorted_positions, offset = index[chrom]
+        p = np.array(p, dtype = np.int64)
+        c = np.array(c, dtype = np.uint8)
+        j = np.searchsorted(sorted_positions, p)
+        hit = j < len(sorted_positions)
+        hit[hit] = sorted_positions[j[hit]] == p[hit]
+        row[offset + j[hit]] = c[hit]  # Records outside variable positions (for example, indels) are ignored.
+        novel += int(np.count_nonzero(~hit & (c < N_CODE)))
+    return row, novel
+
+
+def snp_distances(a, b, chunk_bytes = CHUNK_BYTES):
+    """
+    Computes SNP distances between rows of genotype matrices a (k x m) and b (n x m), which can be memory-mapped.
+    Columns are processed in chunks. For each chunk, the number of positions called in both isolates and the number of
+    identical calls are counted by products of indicator matrices. Returns an int64 array of k x n.
+    """
+    k, m = a.shape
+    n = b.shape[0]
+    d = np.zeros((k, n), dtype = np.int64)
+    step = max(1, min(m, chunk_bytes // (4 * 5 * max(k + n, 1))))  # Each float32 indicator matrix has five columns per position.
+    for start in range(0, m, step):
+        x = indicators(np.asarray(a[:, start : start + step]))
+        y = indicators(np.asarray(b[:, start : start + step]))
+        called = x[:, :, N_CODE] @ y[:, :, N_CODE].T  # Number of positions called in both isolates
+        same = np.zeros_like(called)
+        for base in range(N_CODE):
+            same += x[:, :, base] @ y[:, :, base].T
+        d += np.rint(called - same).astype(np.int64)
+    return d
+
+
+def indicators(g):
+    """
+    Converts a genotype matrix into a float32 array of (rows, columns, 5), where the first four layers indicate A/C/G/T
+    and the last layer indicates called (non-N) positions.
+    """
+    x = np.zeros(g.shape + (5,), dtype = np.float32)
+    for base in range(N_CODE):
+        x[:, :, base] = g == base
+    x[:, :, N_CODE] = g != N_CODE
+    return x
+
+
+def write_sites(sites, tsv):
+    chroms, positions, refs = sites
+    with open(tsv, 'w') as f:
+        f.write('Chrom\tPos\tRef\n')
+        for chrom, pos, ref in zip(chroms, positions, refs):
+            f.write(f'{chrom}\t{pos}\t{chr(BASES[ref])}\n')
+    return
+
+
+def write_alignment(genotypes, isolates, fasta, refs = None):
+    """ Writes the genotype matrix as a multi-FASTA alignment, one line per sequence """
+    lookup = np.frombuffer(BASES, dtype = np.uint8)
+    with open(fasta, 'wb') as f:
+        if refs is not None:
+            f.write(b'>Reference\n' + lookup[refs].tobytes() + b'\n')
+        for i, isolate in enumerate(isolates):
+            f.write(b'>' + isolate.encode() + b'\n' + lookup[genotypes[i]].tobytes() + b'\n')
+    return
+
+
+def write_distances(d, isolates, tsv):
+    with open(tsv, 'w') as f:
+        f.write('\t'.join(['Isolate'] + isolates) + '\n')
+        for i, isolate in enumerate(isolates):
+            f.write(isolate + '\t' + '\t'.join(map(str, d[i])) + '\n')
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Export metrics of job progress from the shared event log of job scripts as a Prometheus textfile, for example, for the
+textfile collector of node_exporter.
+
+Example commands:
+    export PIPELINE_EVENT_LOG=$HOME/pipeline_events.tsv
+    python run_spades.py -r readsets.tsv -o spades -s Slurm  # Job scripts append events to $PIPELINE_EVENT_LOG.
+    python pipeline_metrics.py -l $HOME/pipeline_events.tsv -o /var/lib/node_exporter/textfile/pipeline.prom -i 60
+
+Notes:
+    1. Dependencies: Python >= 3.6.
+    2. Submitters (run_*.py) append 'queued' events when they submit jobs, and job scripts append 'started' and 'done'
+       or 'failed' events of every isolate (see pipeline_modules.log_events).
+    3. Each export only reads bytes appended to the log since the previous export, whose offset and aggregated values
+       are saved in the state file.
+
+Copyright (C) 2026 Yu Wan <wanyuac@126.com>
+Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
+First version: 19 Oct 2026; the latest update: 19 Oct 2026
+"""
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from pipeline_modules import export_metrics
+
+
+def parse_arguments():
+    parser = ArgumentParser(description = "Export Prometheus metrics of job progress from an event log")
+    parser.add_argument('--log', '-l', dest = 'log', type = str, required = False, default = os.environ.get('PIPELINE_EVENT_LOG', ''), help = "Event log (default: environmental variable PIPELINE_EVENT_LOG)")
+    parser.add_argument('--output', '-o', dest = 'output', type = str, required = False, default = 'pipeline.prom', help = "Output textfile (default: pipeline.prom)")
+    parser.add_argument('--state', '-s', dest = 'state', type = str, required = False, default = '', help = "State file of the exporter (default: {output}.state.json)")
+    parser.add_argument('--window', '-w', dest = 'window', type = int, required = False, default = 3600, help = "Time window (seconds) of throughput (default: 3600)")
+    parser.add_argument('--interval', '-i', dest = 'interval', type = int, required = False, default = 0, help = "Export metrics every this number of seconds (default: 0, export once)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.log == '' or not os.path.exists(args.log):
+        print(f"Error: event log '{args.log}' is not accessible.", file = sys.stderr)
+        sys.exit(1)
+    while True:
+        export_metrics(args.log, args.output, args.state, args.window)
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+    return
+
+
+if __name__ == '__main__':
+    main()
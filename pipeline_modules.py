@@ -1,15 +1,24 @@
 #!/usr/bin/env python
 """
 Shared functions for scripts in this repository. These functions were initially developed for
-run_spades.py.
+run_spades.py. Submitters (run_*.py) define tool plugins (subclasses of Tool) and pass them to run_jobs,
+which writes job scripts for a job scheduler (SGE, PBS, Slurm, local or bash) and submits them.
 
 Copyright (C) 2021 Yu Wan <wanyuac@126.com>
 Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
-First version: 6 Aug 2021; the latest update: 19 Oct 2021
+First version: 6 Aug 2021; the latest update: 19 Oct 2026
 """
 import os
 import sys
+import gzip
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import subprocess
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 
 def check_files(i, files):
@@ -75,25 +84,622 @@ def import_assemblies(a):
     return assemblies
 
 
-def write_job_script(script, k, i, out, scheduler):
+Resources = namedtuple('Resources', ['ncpus', 'mem', 'walltime', 'sge_vmem'])  # Resources requested by every job of a tool
+Backend = namedtuple('Backend', ['name', 'ext', 'header', 'submit'])  # A job scheduler: filename extension, header function and submission command
+ANACONDA_MODULES = {'SGE' : 'anaconda/5.3.1_python3', 'PBS' : 'anaconda3/personal'}  # Environmental modules of Anaconda on our HPCs
+
+
+class Tool:
     """
-    Returns the path of the output script
-    k: number of tasks in the current script; i: the index of the current script.
+    Base class of tool plugins for run_jobs. A plugin defines its job name, resources, environmental settings, and the
+    commands and expected outputs of each isolate. Queues, job headers, script writing and submission are shared.
     """
+    name = 'Job'
+
+    def __init__(self, args):
+        self.args = args
+        return
+
+    def resources(self):
+        return Resources(ncpus = '1', mem = '8', walltime = '24:00:00', sge_vmem = True)
+
+    def environment(self, scheduler):
+        """ Returns commands of environmental settings for a job scheduler """
+        return ''
+
+    def prologue(self):
+        """ Returns commands to be run once per job script before isolates are processed """
+        return ''
+
+    def command(self, i, sample):
+        """ Returns commands that process isolate i """
+        raise NotImplementedError
+
+    def outputs(self, i):
+        """ Returns paths of output files expected for isolate i """
+        return []
+
+    def alias(self, i, j):
+        """
+        Returns commands that make outputs of isolate i available as those of its duplicate j. By default, expected
+        outputs are symbolically linked. Tools must override this method when their outputs contain isolate names or
+        when outputs() does not list all their outputs.
+        """
+        lines = list()
+        for a, b in zip(self.outputs(i), self.outputs(j)):
+            lines += [f"mkdir -p {os.path.dirname(os.path.abspath(b))}", f"ln -sfn {os.path.abspath(a)} {os.path.abspath(b)}"]
+        return '\n'.join(lines)
+
+
+def conda_environment(scheduler, conda_env, module = None):
+    """
+    Returns commands that load an environmental module and activate a conda environment. The Anaconda module of each
+    scheduler (ANACONDA_MODULES) is loaded unless another module (or '' for none) is specified.
+    """
+    if module is None:
+        module = ANACONDA_MODULES.get(scheduler, '')
     if scheduler == 'SGE':
-        filename_ext = '.sge'
-    elif scheduler == 'PBS':
-        filename_ext = '.pbs'
+        lines = ['source $HOME/.bash_profile', 'source /etc/profile.d/modules.sh', 'module purge']
+        if module != '':
+            lines.append(f'module load {module}')
+        if conda_env != '':
+            lines.append(f'conda activate {conda_env}')
     else:
-        filename_ext = '.sh'
-    f_name = os.path.join(out, 'job_list_' + str(i) + filename_ext)  # In the future, the filename extension will be determined by the job scheduler.
-    print("Write %i tasks into script %s" % (k, f_name))
+        lines = [f'module load {module}'] if module != '' else []
+        if conda_env != '':
+            lines.append(f'source activate {conda_env}')
+    return '\n'.join(lines)
+
+
+def sge_header(name, res, slots = 1, array = 0):
+    """ Arguments slots and array are only used by Slurm (cf. slurm_header) """
+    header = f"""#!/bin/bash
+# SGE configurations
+#$ -N {name}
+#$ -S /bin/bash
+"""
+    if int(res.ncpus) > 1:
+        header += f"#$ -pe multithread {res.ncpus}\n"
+    if res.sge_vmem:
+        header += f"#$ -l h_vmem={res.mem}G\n"
+    return header
+
+
+def pbs_header(name, res, slots = 1, array = 0):
+    threads = f":ompthreads={res.ncpus}" if int(res.ncpus) > 1 else ""
+    return f"""#!/bin/bash
+# PBS configurations
+#PBS -N {name}
+#PBS -l select=1:ncpus={res.ncpus}:mem={res.mem}gb{threads}
+#PBS -l walltime={res.walltime}
+"""
+
+
+def slurm_header(name, res, slots = 1, array = 0):
+    """
+    slots: number of isolates run concurrently as job steps in each allocation, which requests resources of all slots;
+    array: number of tasks of a job array (0: not a job array).
+    """
+    header = f"""#!/bin/bash
+# Slurm configurations
+#SBATCH --job-name={name}
+#SBATCH --nodes=1
+#SBATCH --ntasks={slots}
+#SBATCH --cpus-per-task={res.ncpus}
+#SBATCH --mem={int(res.mem) * slots}G
+#SBATCH --time={res.walltime}
+"""
+    if array > 0:
+        header += f"#SBATCH --array=1-{array}\n"
+    return header
+
+
+def bash_header(name, res, slots = 1, array = 0):
+    return "#!/bin/bash\n"
+
+
+SCHEDULERS = {'SGE' : Backend('SGE', '.sge', sge_header, ['qsub']),\
+              'PBS' : Backend('PBS', '.pbs', pbs_header, ['qsub']),\
+              'Slurm' : Backend('Slurm', '.slurm', slurm_header, ['sbatch']),\
+              'local' : Backend('local', '.sh', bash_header, None),\
+              'bash' : Backend('bash', '.sh', bash_header, None)}  # Scripts of the 'local' backend are run in a local process pool, whereas 'bash' scripts are not run.
+
+
+def get_backend(scheduler):
+    if scheduler not in SCHEDULERS:
+        print(f"Error: job scheduler {scheduler} is not supported. Choose one of: {'/'.join(SCHEDULERS.keys())}.", file = sys.stderr)
+        sys.exit(1)
+    return SCHEDULERS[scheduler]
+
+
+def job_script_chunks(tool, queues, backend, slots = 1, array = False, aliases = None, event_log = ''):
+    """
+    A generator of text chunks of a job script. Each queue (a dictionary of isolates) is processed serially unless
+    slots > 1, in which case up to 'slots' isolates of the queue run concurrently as Slurm job steps (srun --exclusive).
+    Slots are limited to the number of isolates in the longest queue, so that a short queue does not request idle slots.
+    When array = True, each queue becomes a task of a Slurm job array; otherwise, 'queues' must have a single queue.
+    aliases: a dictionary {isolate : [duplicates]}; outputs of each isolate are aliased for its duplicates after the
+    isolate is processed (see deduplicate_readsets).
+    event_log: path to an event log, to which start and completion events of isolates are appended (see log_events).
+    """
+    if aliases is None:
+        aliases = dict()
+    slots = max(1, min(slots, max(len(q) for q in queues)))  # Requests no more slots than isolates of the longest queue
+    res = tool.resources()
+    yield backend.header(tool.name, res, slots, len(queues) if array else 0)
+    if slots > 1:
+        yield "\nset -a  # Export variables to job steps\n"
+    env = tool.environment(backend.name)
+    if env != '':
+        yield f"\n# Environmental settings\n{env}\n"
+    prologue = tool.prologue()
+    if prologue != '':
+        yield f"\n{prologue}\n"
+    if slots > 1:
+        yield f"""
+# Run function $1 as a job step when one of {slots} slots is free
+function launch {{
+    while [ $(jobs -rp | wc -l) -ge {slots} ]
+    do
+        wait -n
+    done
+    export -f $(compgen -A function)
+    srun --exclusive --nodes=1 --ntasks=1 --cpus-per-task={res.ncpus} --mem={res.mem}G bash -c $1 &
+}}
+"""
+    yield f"\n# {tool.name} jobs\n"
+    if array:
+        yield "case $SLURM_ARRAY_TASK_ID in\n"
+    for n, samples in enumerate(queues, 1):
+        if array:
+            yield f"{n})\n"
+        for k, (i, sample) in enumerate(samples.items(), 1):
+            cmd = '\n'.join([tool.command(i, sample)] + [tool.alias(i, j) for j in aliases.get(i, [])])
+            if event_log != '':
+                cmd = log_events(tool, i, cmd, event_log)
+            if slots > 1:
+                body = '\n'.join('    ' + line if line != '' else line for line in cmd.split('\n'))
+                yield f"function isolate_{k} {{\n{body}\n}}\nlaunch isolate_{k}\n"
+            else:
+                yield cmd + "\n"
+        if array:
+            yield ";;\n"
+    if array:
+        yield "esac\n"
+    if slots > 1:
+        yield "wait\n"
+
+
+def log_events(tool, i, cmd, event_log):
+    """
+    Wraps commands of isolate i with commands appending its events to an event log. Each event is a tab-delimited line
+    of the epoch time, tool name, isolate, event (queued, started, done or failed) and runtime in seconds. An isolate
+    is done when all its expected outputs exist.
+    """
+    event_log = os.path.abspath(event_log)
+    check = ' && '.join(f"[ -e {os.path.abspath(f)} ]" for f in tool.outputs(i)) if len(tool.outputs(i)) > 0 else 'true'
+    event = f"printf '%s\\t{tool.name}\\t{i}\\t%s\\t%s\\n'"
+    return '\n'.join([f"event_start=$(date +%s)", f"{event} $event_start started 0 >> {event_log}", cmd,\
+                      f"if {check}; then event=done; else event=failed; fi", "event_end=$(date +%s)",\
+                      f"{event} $event_end $event $((event_end - event_start)) >> {event_log}"])
+
+
+def create_job_script(tool, samples, scheduler, slots = 1, event_log = ''):
+    """ Returns a job script as a string """
+    return ''.join(job_script_chunks(tool, [samples], get_backend(scheduler), slots, False, None, event_log))
+
+
+def write_job_script(tool, samples, i, out, scheduler, slots = 1, aliases = None, event_log = ''):
+    """
+    Streams a job script into a file and returns the path of the script.
+    i: the index of the current script.
+    """
+    backend = get_backend(scheduler)
+    f_name = os.path.join(out, 'job_list_' + str(i) + backend.ext)
+    print("Write %i tasks into script %s" % (len(samples), f_name))
+    with open(f_name, 'w') as f:
+        f.writelines(job_script_chunks(tool, [samples], backend, slots, False, aliases, event_log))
+    return f_name
+
+
+def write_job_array(tool, queues, out, scheduler, slots = 1, aliases = None, event_log = ''):
+    """ Streams a Slurm job array, whose tasks process the queues, into a file and returns the path of the script """
+    backend = get_backend(scheduler)
+    f_name = os.path.join(out, 'job_array' + backend.ext)
+    print("Write %i tasks as %i array tasks into script %s" % (sum(len(q) for q in queues), len(queues), f_name))
     with open(f_name, 'w') as f:
-        f.write(script)
+        f.writelines(job_script_chunks(tool, queues, backend, slots, True, aliases, event_log))
     return f_name
 
 
+def add_slurm_arguments(parser):
+    """ Adds options of Slurm job arrays and packed nodes to the argument parser of a submitter """
+    parser.add_argument("--array", dest = "array", action = "store_true", help = "(Slurm) Submit job queues as tasks of a job array")
+    parser.add_argument("--node_cores", dest = "node_cores", type = int, required = False, default = 0,\
+                        help = "(Slurm) Number of cores per node. Each allocation runs up to floor(node_cores / ncpus) isolates concurrently (default: 0, serial runs)")
+    return parser
+
+
+def run_jobs(tool, samples, queue, script_dir, scheduler, debug = False, resume = False, array = False, node_cores = 0, aliases = None,\
+             event_log = ''):
+    """
+    Writes isolates in dictionary 'samples' into job scripts of at most 'queue' isolates each and submits the scripts.
+    Isolates whose expected outputs all exist are skipped when resume = True. For Slurm, the queues can be written into
+    a job array (array = True), and isolates of each queue can be packed into a node of node_cores cores. Outputs of
+    isolates in dictionary 'aliases' are aliased for their duplicates, which are not processed. Events of isolates
+    are appended to 'event_log' unless it is empty (see export_metrics). Returns paths of job scripts.
+    """
+    if aliases is None:
+        aliases = dict()
+    backend = get_backend(scheduler)
+    if (array or node_cores > 0) and backend.name != 'Slurm':
+        print("Error: job arrays and packed nodes are only supported by Slurm.", file = sys.stderr)
+        sys.exit(1)
+    slots = max(1, node_cores // int(tool.resources().ncpus))  # Number of isolates run concurrently per allocation
+    if resume:
+        done = set(i for i in samples.keys() if all_outputs_exist(tool.outputs(i)))
+        if len(done) > 0:
+            print(f"{len(done)} isolate(s) are skipped as their outputs exist.")
+            samples = {i : s for i, s in samples.items() if i not in done}
+        for i in done.intersection(aliases.keys()):  # Aliases may be missing from a run without deduplication.
+            subprocess.run(['bash', '-c', '\n'.join(tool.alias(i, j) for j in aliases[i])], check = True)
+    ids = list(samples.keys())
+    queues = ({i : samples[i] for i in ids[k : k + queue]} for k in range(0, len(ids), queue))
+    if array:
+        scripts = [write_job_array(tool, list(queues), script_dir, scheduler, slots, aliases, event_log)] if len(ids) > 0 else []
+    else:
+        scripts = [write_job_script(tool, q, n, script_dir, scheduler, slots, aliases, event_log) for n, q in enumerate(queues, 1)]
+    if debug:
+        print("Debugging mode: no job is submitted.")
+    else:
+        if event_log != '' and backend.name != 'bash':
+            t = int(time.time())
+            with open(event_log, 'a') as f:
+                f.write(''.join(f"{t}\t{tool.name}\t{i}\tqueued\t0\n" for i in ids))
+        submit_jobs(scripts, backend, tool.resources())
+    return scripts
+
+
+def all_outputs_exist(files):
+    return len(files) > 0 and all(os.path.exists(f) for f in files)
+
+
+def submit_jobs(scripts, backend, res):
+    """ Submits job scripts to the scheduler or runs them in a local pool of processes """
+    if backend.submit is not None:
+        for s in scripts:
+            print("Submit job script " + s, file = sys.stdout)
+            p = subprocess.Popen(backend.submit + [s])  # Do not use parameters 'shell = True, stdin = None, stdout = None, stderr = None, close_fds = True', or the job will not be submitted successfully.
+            time.sleep(1)
+    elif backend.name == 'local':
+        n = max(1, (os.cpu_count() or 1) // int(res.ncpus))  # Number of concurrent job scripts
+        print(f"Run {len(scripts)} job script(s) locally with {n} concurrent process(es).", file = sys.stdout)
+        with ThreadPoolExecutor(max_workers = n) as pool:
+            for s, code in zip(scripts, pool.map(run_local_script, scripts)):
+                if code != 0:
+                    print(f"Warning: job script {s} exited with status {code}.", file = sys.stderr)
+    else:
+        print("Bash mode: no job is submitted.", file = sys.stdout)
+    return
+
+
+def run_local_script(script):
+    """ Runs a job script with bash and saves its stdout and stderr in {script}.log """
+    with open(script + '.log', 'w') as log:
+        return subprocess.run(['bash', script], stdout = log, stderr = subprocess.STDOUT).returncode
+
+
 def check_dir(d):
     if not os.path.exists(d):
         os.mkdir(d)
     return
+
+
+def file_sha256(f, block_size = 1 << 20):
+    """ Returns the SHA-256 digest of a file's content, which is read in blocks """
+    h = hashlib.sha256()
+    with open(f, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_reference(ref, cache_dir):
+    """
+    Copies a reference FASTA file into a cache and returns the directory of its cache entry, which contains the copy
+    'ref.fasta' and the indexes built from it. Entries are keyed by the SHA-256 digest of the file content, so the same
+    reference shares its indexes regardless of file names or locations. A lock file '{entry}.lock' serialises concurrent
+    submissions as well as index building in job scripts (see run_phenix.py).
+    """
+    if not os.path.exists(ref):
+        print(f"Error: reference file {ref} is not accessible.", file = sys.stderr)
+        sys.exit(1)
+    check_dir(cache_dir)
+    entry = os.path.join(os.path.abspath(cache_dir), file_sha256(ref))
+    cached = os.path.join(entry, 'ref.fasta')
+    with open(entry + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(cached):
+            check_dir(entry)
+            shutil.copyfile(ref, cached + '.tmp')
+            os.replace(cached + '.tmp', cached)  # Other processes never see a partial copy.
+            print(f"Reference {ref} has been added to the cache as {cached}.")
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    return entry
+
+
+def add_metrics_arguments(parser):
+    """ Adds the option of the event log (see log_events and export_metrics) to the argument parser of a submitter """
+    parser.add_argument("--event_log", dest = "event_log", type = str, required = False, default = os.environ.get("PIPELINE_EVENT_LOG", ""),\
+                        help = "(Optional) Shared event log of job progress (default: environmental variable PIPELINE_EVENT_LOG or none)")
+    return parser
+
+
+def export_metrics(event_log, textfile, state_file = '', window = 3600, max_runtimes = 1000):
+    """
+    Reads new lines of an event log (see log_events) and writes metrics of each tool in Prometheus' text format:
+    counts of events, throughput (isolates done per hour over the last 'window' seconds), queue depth (queued but not
+    started), running isolates, the failure ratio and the median and 95th percentile of runtimes of the last
+    'max_runtimes' isolates done. The byte offset of the log and aggregated values are saved in a state file (default:
+    {textfile}.state.json), so each call only reads bytes appended since the last call. The log is read from the start
+    again when it is replaced or truncated.
+    """
+    if state_file == '':
+        state_file = textfile + '.state.json'
+    state = {'inode' : None, 'offset' : 0, 'tools' : dict()}
+    if os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+    st = os.stat(event_log)
+    if state['inode'] != st.st_ino or st.st_size < state['offset']:
+        state['inode'], state['offset'] = st.st_ino, 0
+    with open(event_log, 'rb') as f:
+        f.seek(state['offset'])
+        data = f.read(st.st_size - state['offset'])
+    data = data[ : data.rfind(b'\n') + 1]  # An incomplete last line is read next time.
+    state['offset'] += len(data)
+    now = time.time()
+    for line in data.decode().splitlines():
+        try:
+            t, name, _, event, runtime = line.split('\t')
+            t, runtime = int(t), int(runtime)
+        except ValueError:
+            print(f"Warning: line '{line}' in the event log cannot be parsed.", file = sys.stderr)
+            continue
+        tool = state['tools'].setdefault(name, {'counts' : {e : 0 for e in ['queued', 'started', 'done', 'failed']}, 'done_times' : [], 'runtimes' : []})
+        tool['counts'][event] = tool['counts'].get(event, 0) + 1
+        if event == 'done':
+            tool['done_times'].append(t)
+            tool['runtimes'].append(runtime)
+    lines = ["# HELP pipeline_events_total Number of events of isolates in the event log.", "# TYPE pipeline_events_total counter"]
+    gauges = {'pipeline_throughput_per_hour' : "Isolates done per hour over the recent window.",\
+              'pipeline_queue_depth' : "Isolates queued but not started.",\
+              'pipeline_running' : "Isolates started but not finished.",\
+              'pipeline_failure_ratio' : "Fraction of finished isolates that failed.",\
+              'pipeline_runtime_seconds' : "Quantiles of runtimes of recent isolates done."}
+    values = {m : [] for m in gauges.keys()}
+    for name in sorted(state['tools'].keys()):
+        tool = state['tools'][name]
+        tool['done_times'] = [t for t in tool['done_times'] if t >= now - window]
+        tool['runtimes'] = tool['runtimes'][-max_runtimes : ]
+        c = tool['counts']
+        lines += [f'pipeline_events_total{{tool="{name}",event="{e}"}} {n}' for e, n in sorted(c.items())]
+        finished = c['done'] + c['failed']
+        values['pipeline_throughput_per_hour'].append((f'tool="{name}"', round(len(tool['done_times']) * 3600 / window, 3)))
+        values['pipeline_queue_depth'].append((f'tool="{name}"', max(0, c['queued'] - c['started'])))
+        values['pipeline_running'].append((f'tool="{name}"', max(0, c['started'] - finished)))
+        values['pipeline_failure_ratio'].append((f'tool="{name}"', round(c['failed'] / finished, 4) if finished > 0 else 0))
+        runtimes = sorted(tool['runtimes'])
+        for q in [0.5, 0.95]:
+            if len(runtimes) > 0:
+                values['pipeline_runtime_seconds'].append((f'tool="{name}",quantile="{q}"', runtimes[min(len(runtimes) - 1, int(q * len(runtimes)))]))
+    for m, description in gauges.items():
+        lines += [f"# HELP {m} {description}", f"# TYPE {m} gauge"] + [f"{m}{{{labels}}} {v}" for labels, v in values[m]]
+    for f, content in [(state_file, json.dumps(state)), (textfile, '\n'.join(lines) + '\n')]:
+        with open(f + '.tmp', 'w') as fh:
+            fh.write(content)
+        os.replace(f + '.tmp', f)  # The textfile collector never reads a partial file.
+    return
+
+
+def add_dedup_arguments(parser, near = True):
+    """
+    Adds options of duplicate read-set detection (see deduplicate_readsets) to the argument parser of a submitter.
+    near = False disables mode 'near' for tools that must not alias isolates unless their reads are identical.
+    """
+    modes = ["none", "exact", "near"] if near else ["none", "exact"]
+    description = "exact (identical reads) or near (also copies of the same reads, such as recompressed files or renamed reads)" if near else "exact (identical reads)"
+    parser.add_argument("--dedup", dest = "dedup", type = str, required = False, default = "none", choices = modes,\
+                        help = f"Process duplicate read sets once and alias their outputs: {description}. Re-sequenced isolates are not detected (default: none)")
+    parser.add_argument("--min_similarity", dest = "min_similarity", type = float, required = False, default = 0.95,\
+                        help = "Minimum estimated Jaccard similarity of k-mers for near-duplicate read sets (default: 0.95)")
+    parser.add_argument("--fingerprint_mb", dest = "fingerprint_mb", type = int, required = False, default = 16,\
+                        help = "Megabytes of decompressed reads per file used for fingerprints (default: 16)")
+    parser.add_argument("--fingerprint_cache", dest = "fingerprint_cache", type = str, required = False, default = "",\
+                        help = "Cache file of read-set fingerprints (default: {readsets}.fingerprints.json)")
+    parser.add_argument("--fingerprint_ncpus", dest = "fingerprint_ncpus", type = int, required = False, default = 1,\
+                        help = "Number of processes for computing fingerprints, each using about 150 MB of memory with the default --fingerprint_mb (default: 1)")
+    return parser
+
+
+FINGERPRINT_K = 21  # k-mer size of MinHash signatures
+FINGERPRINT_BINS = 256  # Length of a MinHash signature (one-permutation hashing)
+FINGERPRINT_BANDS = 16  # Bands of signatures for finding candidate near-duplicates (locality-sensitive hashing)
+MAX_UINT64 = (1 << 64) - 1  # Value of empty bins of MinHash signatures
+FINGERPRINT_CHUNK = 1 << 20  # Number of bases per chunk of reads in computing MinHash signatures, which bounds sizes of k-mer arrays
+
+
+def read_prefix(f, size):
+    """ Returns complete lines in the first 'size' bytes of a (gzip-compressed) FASTQ file """
+    with open(f, 'rb') as fh:
+        compressed = fh.read(2) == b'\x1f\x8b'
+    with (gzip.open(f, 'rb') if compressed else open(f, 'rb')) as fh:
+        data = fh.read(size)
+    if len(data) == size:
+        data = data[ : data.rfind(b'\n') + 1]
+    return data
+
+
+def kmer_signature(seqs, k = FINGERPRINT_K, bins = FINGERPRINT_BINS, chunk = FINGERPRINT_CHUNK):
+    """
+    Returns a MinHash signature (minimum hash per bin) of canonical k-mers in a list of sequences, where k <= 31 and
+    empty bins hold the maximum of uint64. Sequences are processed in chunks of about 'chunk' bases.
+    """
+    import numpy as np
+    sig = np.full(bins, MAX_UINT64, dtype = np.uint64)
+    group, size = list(), 0
+    for s in seqs:
+        group.append(s)
+        size += len(s) + 1
+        if size >= chunk:
+            update_signature(sig, group, k)
+            group, size = list(), 0
+    update_signature(sig, group, k)
+    return sig
+
+
+def update_signature(sig, seqs, k):
+    """ Updates a MinHash signature in place with canonical k-mers in a list of sequences """
+    import numpy as np
+    lookup = np.full(256, 4, dtype = np.uint64)
+    for b, c in zip(b'ACGTacgt', [0, 1, 2, 3, 0, 1, 2, 3]):
+        lookup[b] = c
+    bins = len(sig)
+    codes = lookup[np.frombuffer(b'N'.join(seqs), dtype = np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return
+    invalid = np.concatenate([[0], np.cumsum(codes == 4)])
+    valid = invalid[k : ] == invalid[ : n]  # k-mers without ambiguous bases or separators
+    fwd = np.zeros(n, dtype = np.uint64)
+    rev = np.zeros(n, dtype = np.uint64)
+    for j in range(k):
+        fwd = (fwd << np.uint64(2)) | codes[j : j + n]
+        rev |= (np.uint64(3) - codes[j : j + n]) << np.uint64(2 * j)  # Values of invalid k-mers are discarded.
+    h = np.minimum(fwd, rev)[valid]
+    for shift, factor in [(33, 0xff51afd7ed558ccd), (33, 0xc4ceb9fe1a85ec53), (33, None)]:  # The finaliser of MurmurHash3
+        h ^= h >> np.uint64(shift)
+        if factor is not None:
+            h *= np.uint64(factor)
+    np.minimum.at(sig, (h % np.uint64(bins)).astype(np.intp), h)
+    return
+
+
+def readset_fingerprint(task):
+    """
+    Returns the fingerprint of a read set: a content digest of the first 'size' bytes of both read files and their
+    file sizes, and a MinHash signature of k-mers in these reads (None unless 'signature' is True).
+    """
+    r1, r2, size, signature = task
+    h = hashlib.sha256()
+    seqs = list()
+    for f in [r1, r2]:
+        data = read_prefix(f, size)
+        h.update(data + str(os.path.getsize(f)).encode() + b'\n')
+        lines = data.split(b'\n')
+        if signature:
+            seqs += lines[1 : len(lines) - len(lines) % 4 : 4]  # Sequence lines of complete records
+    return h.hexdigest(), [int(x) for x in kmer_signature(seqs)] if signature else None
+
+
+def fingerprint_readsets(readsets, cache, size, ncpus = 1, signatures = False):
+    """
+    Returns a dictionary {isolate : (digest, signature)} of read sets, where signatures are None unless signatures = True
+    as they cost most of the time. Fingerprints are computed in a pool of 'ncpus' processes and cached in a JSON file,
+    where each entry is keyed by paths of read files and reused while their sizes and modification times do not change.
+    Signatures are added to cached entries of digests when they are first required.
+    """
+    params = {'size' : size, 'k' : FINGERPRINT_K, 'bins' : FINGERPRINT_BINS}
+    entries = dict()
+    if os.path.exists(cache):
+        with open(cache, 'r') as f:
+            c = json.load(f)
+        if c.get('params') == params:
+            entries = c['entries']
+    stats = dict()
+    for i, r in readsets.items():
+        key = os.path.abspath(r.r1) + '\t' + os.path.abspath(r.r2)
+        st = [os.stat(r.r1), os.stat(r.r2)]
+        stats[i] = (key, [s.st_size for s in st] + [s.st_mtime_ns for s in st])
+    new = [i for i in readsets.keys() if stats[i][0] not in entries or entries[stats[i][0]]['stat'] != stats[i][1] or\
+           (signatures and 'signature' not in entries[stats[i][0]])]
+    if len(new) > 0:
+        print(f"Compute fingerprints of {len(new)} read set(s).")
+        with ProcessPoolExecutor(max_workers = max(1, ncpus)) as pool:
+            for i, (digest, sig) in zip(new, pool.map(readset_fingerprint, [(readsets[i].r1, readsets[i].r2, size, signatures) for i in new])):
+                entries[stats[i][0]] = {'stat' : stats[i][1], 'digest' : digest}
+                if sig is not None:
+                    entries[stats[i][0]]['signature'] = sig
+        with open(cache + '.tmp', 'w') as f:
+            json.dump({'params' : params, 'entries' : entries}, f)
+        os.replace(cache + '.tmp', cache)
+    return {i : (entries[stats[i][0]]['digest'], entries[stats[i][0]].get('signature')) for i in readsets.keys()}
+
+
+def deduplicate_readsets(readsets, args):
+    """
+    Clusters read sets with identical fingerprint digests (args.dedup = 'exact') or with MinHash signatures of an
+    estimated Jaccard similarity >= args.min_similarity as well (args.dedup = 'near'), using options added by
+    add_dedup_arguments and the sample sheet args.readsets. Candidate pairs of near-duplicates are found by banding
+    signatures. Mode 'near' only finds copies of the same reads (for example, recompressed files or renamed reads):
+    re-sequenced isolates differ in sampled reads and sequencing errors, so their similarity (for example, about 0.8 for
+    two 4x read sets of a genome) is indistinguishable from that of distinct isolates of an outbreak clone. Returns a
+    dictionary of the first read set of each cluster in the input order and a dictionary {representative : [duplicates]}
+    for run_jobs.
+    """
+    if args.dedup == 'none':
+        return readsets, dict()
+    mode, min_similarity = args.dedup, args.min_similarity
+    cache = args.fingerprint_cache if args.fingerprint_cache != '' else args.readsets + '.fingerprints.json'
+    fingerprints = fingerprint_readsets(readsets, cache, args.fingerprint_mb << 20, args.fingerprint_ncpus, mode == 'near')
+    ids = list(readsets.keys())
+    parent = list(range(len(ids)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(x, y):
+        x, y = find(x), find(y)
+        if x != y:
+            parent[max(x, y)] = min(x, y)  # Earlier read sets represent clusters.
+        return
+
+    buckets = dict()
+    for k, i in enumerate(ids):
+        buckets.setdefault(fingerprints[i][0], []).append(k)
+    for members in buckets.values():
+        for k in members[1 : ]:
+            union(members[0], k)
+    if mode == 'near':
+        reps = sorted(set(find(k) for k in range(len(ids))))
+        w = FINGERPRINT_BINS // FINGERPRINT_BANDS
+        for b in range(FINGERPRINT_BANDS):
+            buckets = dict()
+            for k in reps:
+                buckets.setdefault(tuple(fingerprints[ids[k]][1][b * w : (b + 1) * w]), []).append(k)
+            for members in buckets.values():
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        if find(members[x]) != find(members[y]) and signature_similarity(fingerprints[ids[members[x]]][1], fingerprints[ids[members[y]]][1]) >= min_similarity:
+                            union(members[x], members[y])
+    aliases = dict()
+    for k, i in enumerate(ids):
+        r = find(k)
+        if r != k:
+            aliases.setdefault(ids[r], []).append(i)
+    for i, dups in aliases.items():
+        print(f"Read set(s) {', '.join(dups)} duplicate(s) {i} and will be aliased to it.")
+    n = sum(len(d) for d in aliases.values())
+    print(f"{n} duplicate read set(s) have/has been found.")
+    duplicates = set(j for d in aliases.values() for j in d)
+    return {i : r for i, r in readsets.items() if i not in duplicates}, aliases
+
+
+def signature_similarity(a, b):
+    """ Estimates the Jaccard similarity of two MinHash signatures from bins that are not empty in both """
+    pairs = [(x, y) for x, y in zip(a, b) if x != MAX_UINT64 or y != MAX_UINT64]
+    return sum(x == y for x, y in pairs) / len(pairs) if len(pairs) > 0 else 1.0
+
@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+"""
+Compile Prokka's annotations of isolates into a columnar store with inverted indexes from gene names, products and
+EC numbers to isolates, and query the store.
+
+Example commands:
+    python prokka_store.py create -s annot_store -n 8 -i output/*/
+    python prokka_store.py add -s annot_store -n 8 -i new_output/*/
+    python prokka_store.py query -s annot_store -g blaCTX-M-15 > isolates.tsv
+    python prokka_store.py query -s annot_store -p 'beta-lactamase' -x -f > features.tsv
+
+Store files:
+    manifest.json: numbers of isolates and features, and sizes of all other files when the last update was committed.
+                   This file is replaced at the end of each update. Readers ignore data beyond these sizes, and updates
+                   truncate files to these sizes before appending;
+    .lock: a lock file serialising updates of the store;
+    isolates.txt: isolate names in the order of isolate IDs;
+    {column}.u32, strand.u8: columns of features (isolate ID, start, end and codes of string columns);
+    {field}.txt: terms of string columns (ftype, contig, gene, ec, product) in the order of their codes. Code 0 is the
+                 empty string;
+    locus_tags.txt, locus_tags.ends.u64: locus tags of features and end offsets of their lines, so that locus tags of
+                 rows are read without loading the file;
+    index.{field}.isolates, index.{field}.rows: inverted indexes from codes of each of gene, ec and product to sorted
+                 isolate IDs and to row numbers of features (see write_index).
+
+Notes:
+    1. Dependencies: Python >= 3.6, NumPy.
+    2. Each input directory is a Prokka output directory {g} containing {g}.tsv, where {g} is the isolate name.
+       Coordinates of features are taken from {g}.gff when it exists. Gene features of Prokka's --addgenes are skipped
+       as they duplicate CDS features.
+    3. Directories are parsed in a process pool, and adding isolates only parses their files. Inverted indexes are
+       rebuilt from the columns at the end of each update with NumPy, written to temporary files and renamed into
+       place before the manifest is replaced. Updates hold an exclusive lock on the store, and queries never modify it.
+    4. Queries are exact terms by default and Python regular expressions (searched in terms) with --regex. Prokka
+       appends suffixes such as '_1' to duplicated gene names, which can be matched with --regex.
+
+Copyright (C) 2026 Yu Wan <wanyuac@126.com>
+Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
+First version: 19 Oct 2026; the latest update: 19 Oct 2026
+"""
+
+import os
+import re
+import sys
+import json
+import fcntl
+import numpy as np
+from multiprocessing import Pool
+from argparse import ArgumentParser
+from pipeline_modules import check_dir
+
+STRING_COLUMNS = ['ftype', 'contig', 'gene', 'ec', 'product']  # Dictionary-encoded columns
+INDEXED_COLUMNS = ['gene', 'ec', 'product']
+INT_COLUMNS = ['isolate', 'start', 'end']
+STRANDS = ['.', '+', '-']
+
+
+def parse_arguments():
+    parser = ArgumentParser(description = "Create, update and query a store of Prokka annotations")
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+    for command, description in [('create', "Create a store from Prokka output directories"), ('add', "Add Prokka output directories of new isolates to a store")]:
+        p = subparsers.add_parser(command, help = description)
+        p.add_argument('-s', '--store', dest = 'store', type = str, required = True, help = "Directory of the store")
+        p.add_argument('-i', '--input', dest = 'input', nargs = '+', type = str, required = True, help = "Prokka output directories {g}, each containing {g}.tsv and {g}.gff")
+        p.add_argument('-n', '--ncpus', dest = 'ncpus', type = int, required = False, default = 1, help = "Number of processes for parsing annotations (default: 1)")
+        if command == 'create':
+            p.add_argument('-f', '--force', dest = 'force', action = 'store_true', help = "Overwrite an existing store")
+    p = subparsers.add_parser('query', help = "Print isolates or features matching genes, products or EC numbers")
+    p.add_argument('-s', '--store', dest = 'store', type = str, required = True, help = "Directory of the store")
+    p.add_argument('-g', '--gene', dest = 'gene', nargs = '+', type = str, required = False, default = [], help = "Gene names")
+    p.add_argument('-p', '--product', dest = 'product', nargs = '+', type = str, required = False, default = [], help = "Products")
+    p.add_argument('-e', '--ec', dest = 'ec', nargs = '+', type = str, required = False, default = [], help = "EC numbers")
+    p.add_argument('-x', '--regex', dest = 'regex', action = 'store_true', help = "Treat queries as regular expressions")
+    p.add_argument('-f', '--features', dest = 'features', action = 'store_true', help = "Print matching features instead of isolates")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.command == 'query':
+        store = AnnotationStore(args.store)
+        queries = [(field, q) for field in INDEXED_COLUMNS for q in getattr(args, field)]
+        if len(queries) == 0:
+            print("Error: no query is specified.", file = sys.stderr)
+            sys.exit(1)
+        if args.features:
+            print('\t'.join(['Query', 'Isolate', 'Locus_tag', 'Ftype', 'Contig', 'Start', 'End', 'Strand', 'Gene', 'EC_number', 'Product']), file = sys.stdout)
+            for field, q in queries:
+                for row in store.features(field, store.match(field, q, args.regex)):
+                    print('\t'.join([q] + row), file = sys.stdout)
+        else:
+            print('\t'.join(['Query', 'Isolate']), file = sys.stdout)
+            for field, q in queries:
+                for i in store.isolates_with(field, store.match(field, q, args.regex)):
+                    print(f"{q}\t{i}", file = sys.stdout)
+    else:
+        dirs = [d.rstrip('/') for d in args.input if os.path.isdir(d)]
+        for d in args.input:
+            if not os.path.isdir(d):
+                print(f"Warning: input {d} is ignored as it is not a directory.", file = sys.stderr)
+        if len(dirs) == 0:
+            print("Error: no Prokka output directory was found. Exit.", file = sys.stderr)
+            sys.exit(1)
+        if args.command == 'create':
+            store = AnnotationStore.create(args.store, args.force)
+        else:
+            store = AnnotationStore(args.store)
+        store.add(dirs, args.ncpus)
+        print(f"The store has {store.n} isolates and {store.rows} features.", file = sys.stderr)
+    return
+
+
+class AnnotationStore:
+    """ A directory of append-only feature columns and inverted indexes """
+
+    def __init__(self, store):
+        self.store = store
+        self.manifest_file = os.path.join(store, 'manifest.json')
+        self.lock_file = os.path.join(store, '.lock')
+        if not os.path.exists(self.manifest_file):
+            print(f"Error: {store} is not an annotation store.", file = sys.stderr)
+            sys.exit(1)
+        self.__load()
+        return
+
+    @classmethod
+    def create(cls, store, force = False):
+        """ Creates an empty store. An existing store is only overwritten when force = True. """
+        if os.path.exists(os.path.join(store, 'manifest.json')) and not force:
+            print(f"Error: {store} is an existing annotation store. Use command 'add' to add isolates, or --force to overwrite it.", file = sys.stderr)
+            sys.exit(1)
+        check_dir(store)
+        files = ['isolates.txt', 'locus_tags.txt', 'locus_tags.ends.u64', 'strand.u8'] + [c + '.u32' for c in INT_COLUMNS + STRING_COLUMNS]
+        with open(os.path.join(store, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            for f in files:
+                open(os.path.join(store, f), 'w').close()
+            for c in INDEXED_COLUMNS:  # Indexes of an overwritten store
+                for f in [f'index.{c}.isolates', f'index.{c}.rows']:
+                    if os.path.exists(os.path.join(store, f)):
+                        os.remove(os.path.join(store, f))
+            for c in STRING_COLUMNS:
+                with open(os.path.join(store, c + '.txt'), 'w') as f:
+                    f.write('\n')  # Code 0: the empty string
+            sizes = {f : os.path.getsize(os.path.join(store, f)) for f in files + [c + '.txt' for c in STRING_COLUMNS]}
+            write_manifest(os.path.join(store, 'manifest.json'), {'isolates' : 0, 'rows' : 0, 'sizes' : sizes})
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        return cls(store)
+
+    def path(self, f):
+        return os.path.join(self.store, f)
+
+    def __load(self):
+        """ Reads the manifest and isolate names committed by the last update. Data beyond the manifest are ignored. """
+        with open(self.manifest_file, 'r') as f:
+            self.manifest = json.load(f)
+        self.n = self.manifest['isolates']
+        self.rows = self.manifest['rows']
+        for f, size in self.manifest['sizes'].items():
+            if os.path.getsize(self.path(f)) < size:
+                print(f"Error: {f} is shorter than expected from manifest.json.", file = sys.stderr)
+                sys.exit(1)
+        self.isolates = self.read_lines('isolates.txt')
+        self.index = {i : k for k, i in enumerate(self.isolates)}
+        return
+
+    def __truncate(self):
+        """ Removes data of an interrupted update, which were written before manifest.json. Only called under the lock. """
+        for f, size in self.manifest['sizes'].items():
+            if os.path.getsize(self.path(f)) > size:
+                print(f"Warning: data of an interrupted update are removed from {f}.", file = sys.stderr)
+                os.truncate(self.path(f), size)
+        return
+
+    def read_lines(self, f):
+        """ Returns lines of a text file of the store up to its size in the manifest """
+        with open(self.path(f), 'rb') as h:
+            return h.read(self.manifest['sizes'][f]).decode().split('\n')[ : -1]
+
+    def column(self, c):
+        """ Returns a column of features as a memory-mapped array """
+        dtype = np.uint8 if c == 'strand' else np.uint32
+        if self.rows == 0:
+            return np.zeros(0, dtype = dtype)
+        return np.memmap(self.path(c + ('.u8' if c == 'strand' else '.u32')), dtype = dtype, mode = 'r', shape = (self.rows,))
+
+    def terms(self, c):
+        return self.read_lines(c + '.txt')
+
+    def add(self, dirs, ncpus):
+        """ Parses Prokka outputs of new isolates and appends their features to the store under the lock of the store """
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.__load()  # Isolates may have been added by another process since the store was opened.
+            self.__truncate()
+            if self.manifest.get('indexed_rows') != self.rows:  # Indexes of an interrupted update
+                self.__build_indexes()
+                write_manifest(self.manifest_file, self.manifest)
+            self.__append(dirs, ncpus)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        return
+
+    def __append(self, dirs, ncpus):
+        """ Appends features of new isolates, rebuilds indexes and commits the update. Only called under the lock. """
+        isolates = [os.path.basename(d) for d in dirs]
+        new = [(i, d) for i, d in zip(isolates, dirs) if i not in self.index]
+        for i in set(isolates) - set(i for i, _ in new):
+            print(f"Warning: isolate {i} is ignored as it is already in the store.", file = sys.stderr)
+        if len(set(i for i, _ in new)) < len(new):
+            print("Error: isolate names derived from directory names are not unique.", file = sys.stderr)
+            sys.exit(1)
+        if len(new) == 0:
+            return
+        vocab = {c : {t : k for k, t in enumerate(self.terms(c))} for c in STRING_COLUMNS}
+        vocab_size = {c : len(vocab[c]) for c in STRING_COLUMNS}
+        added = list()
+        handles = {c : open(self.path(c + '.u32'), 'ab') for c in INT_COLUMNS + STRING_COLUMNS}
+        handles['strand'] = open(self.path('strand.u8'), 'ab')
+        handles['locus_tag'] = open(self.path('locus_tags.txt'), 'ab')
+        handles['locus_tag_end'] = open(self.path('locus_tags.ends.u64'), 'ab')
+        locus_tag_end = self.manifest['sizes']['locus_tags.txt']
+        with Pool(ncpus) as pool:
+            for (i, _), features in zip(new, pool.imap(parse_prokka, new, chunksize = 4)):
+                if features is None:
+                    print(f"Warning: isolate {i} is skipped as its Prokka TSV file is not found.", file = sys.stderr)
+                    continue
+                isolate_id = self.n + len(added)
+                handles['isolate'].write(np.full(len(features['start']), isolate_id, dtype = np.uint32).tobytes())
+                for c in ['start', 'end']:
+                    handles[c].write(np.array(features[c], dtype = np.uint32).tobytes())
+                handles['strand'].write(np.array(features['strand'], dtype = np.uint8).tobytes())
+                for c in STRING_COLUMNS:
+                    codes = [vocab[c].setdefault(t, len(vocab[c])) for t in features[c]]
+                    handles[c].write(np.array(codes, dtype = np.uint32).tobytes())
+                tags = [(t + '\n').encode() for t in features['locus_tag']]
+                handles['locus_tag'].write(b''.join(tags))
+                ends = locus_tag_end + np.cumsum([len(t) for t in tags], dtype = np.uint64)
+                handles['locus_tag_end'].write(ends.astype(np.uint64).tobytes())
+                locus_tag_end += sum(len(t) for t in tags)
+                added.append(i)
+                self.rows += len(features['start'])
+        for h in handles.values():
+            h.close()
+        for c in STRING_COLUMNS:
+            with open(self.path(c + '.txt'), 'a') as f:
+                f.write(''.join(t + '\n' for t in list(vocab[c].keys())[vocab_size[c] : ]))
+        with open(self.path('isolates.txt'), 'a') as f:
+            f.write(''.join(i + '\n' for i in added))
+        self.isolates.extend(added)
+        for i in added:
+            self.index[i] = self.n
+            self.n += 1
+        self.manifest = {'isolates' : self.n, 'rows' : self.rows, 'sizes' : {f : os.path.getsize(self.path(f)) for f in self.manifest['sizes'].keys()}}
+        self.__build_indexes()
+        write_manifest(self.manifest_file, self.manifest)  # Commits the update
+        print(f"{len(added)} isolate(s) have/has been added to the store.", file = sys.stderr)
+        return
+
+    def __build_indexes(self):
+        """
+        Builds inverted indexes from term codes to sorted isolate IDs and to row numbers of features. Each index is
+        written to a temporary file and renamed into place, and readers skip IDs beyond their manifest.
+        """
+        isolate_ids = np.asarray(self.column('isolate'), dtype = np.uint64)
+        for c in INDEXED_COLUMNS:
+            column = np.asarray(self.column(c), dtype = np.uint64)
+            bins = np.arange(len(self.terms(c)) + 1, dtype = np.uint64)
+            pairs = np.unique((column << np.uint64(32)) | isolate_ids)
+            offsets = np.searchsorted(pairs >> np.uint64(32), bins).astype(np.int64)
+            offsets[0] = offsets[1]  # The empty string is not indexed.
+            write_index(self.path(f'index.{c}.isolates'), offsets, (pairs & np.uint64(0xFFFFFFFF)).astype(np.uint32))
+            rows = np.argsort(column, kind = 'stable')  # Row numbers grouped by codes, in ascending order within each code
+            offsets = np.searchsorted(column[rows], bins).astype(np.int64)
+            offsets[0] = offsets[1]
+            write_index(self.path(f'index.{c}.rows'), offsets, rows.astype(np.uint32))
+        self.manifest['indexed_rows'] = self.rows
+        return
+
+    def match(self, c, query, regex = False):
+        """ Returns an array of codes of terms in column c that match a query """
+        terms = self.terms(c)
+        if regex:
+            pattern = re.compile(query)
+            return np.array([k for k, t in enumerate(terms) if k > 0 and pattern.search(t)], dtype = np.int64)
+        return np.array([k for k, t in enumerate(terms) if k > 0 and t == query], dtype = np.int64)
+
+    def lookup(self, index, codes, limit):
+        """ Returns sorted, unique IDs (below 'limit') of the given codes in an inverted index file """
+        offsets, postings = read_index(self.path(index))
+        ids = np.unique(np.concatenate([postings[offsets[k] : offsets[k + 1]] for k in codes if k < len(offsets) - 1] + [np.zeros(0, dtype = np.uint32)]))
+        return ids[ids < limit]
+
+    def isolates_with(self, c, codes):
+        """ Returns names of isolates carrying any term of the given codes, looked up in the inverted index """
+        return [self.isolates[k] for k in self.lookup(f'index.{c}.isolates', codes, self.n)]
+
+    def features(self, c, codes):
+        """
+        Returns a list of rows of strings for features whose column c has any of the given codes. Row numbers are looked
+        up in the inverted index, and only these rows of columns and locus tags are read.
+        """
+        rows = self.lookup(f'index.{c}.rows', codes, self.rows)
+        if len(rows) == 0:
+            return []
+        ends = np.memmap(self.path('locus_tags.ends.u64'), dtype = np.uint64, mode = 'r', shape = (self.rows,))
+        locus_tags = list()
+        with open(self.path('locus_tags.txt'), 'rb') as f:
+            for r in rows:
+                start = int(ends[r - 1]) if r > 0 else 0
+                f.seek(start)
+                locus_tags.append(f.read(int(ends[r]) - start - 1).decode())  # Without the newline character
+        terms = {s : self.terms(s) for s in STRING_COLUMNS}
+        columns = {s : self.column(s)[rows] for s in INT_COLUMNS + STRING_COLUMNS + ['strand']}
+        return [[self.isolates[columns['isolate'][k]], locus_tags[k], terms['ftype'][columns['ftype'][k]], terms['contig'][columns['contig'][k]],\
+                 str(columns['start'][k]), str(columns['end'][k]), STRANDS[columns['strand'][k]], terms['gene'][columns['gene'][k]],\
+                 terms['ec'][columns['ec'][k]], terms['product'][columns['product'][k]]] for k in range(len(rows))]
+
+
+def write_manifest(json_file, manifest):
+    with open(json_file + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(json_file + '.tmp', json_file)
+    return
+
+
+def write_index(index, offsets, postings):
+    """
+    Writes an inverted index file: the number of codes K (int64), offsets of the K codes and the end (int64) and
+    postings (uint32), where postings of code c are postings[offsets[c] : offsets[c + 1]].
+    """
+    with open(index + '.tmp', 'wb') as f:
+        np.array([len(offsets) - 1], dtype = np.int64).tofile(f)
+        offsets.astype(np.int64).tofile(f)
+        postings.astype(np.uint32).tofile(f)
+    os.replace(index + '.tmp', index)  # Readers never see a partial index.
+    return
+
+
+def read_index(index):
+    """ Returns offsets and memory-mapped postings of an inverted index file written by write_index """
+    k = int(np.fromfile(index, dtype = np.int64, count = 1)[0])
+    offsets = np.fromfile(index, dtype = np.int64, count = k + 2)[1 : ]
+    if offsets[-1] == 0:
+        return offsets, np.zeros(0, dtype = np.uint32)
+    return offsets, np.memmap(index, dtype = np.uint32, mode = 'r', offset = (k + 2) * 8, shape = (int(offsets[-1]),))
+
+
+def parse_prokka(task):
+    """
+    Parses {g}.tsv and {g}.gff of isolate g in a Prokka output directory. Returns a dictionary of feature columns, or
+    None when the TSV file is not found.
+    """
+    g, d = task
+    tsv = os.path.join(d, g + '.tsv')
+    gff = os.path.join(d, g + '.gff')
+    if not os.path.exists(tsv):
+        return None
+    coords = dict()  # {locus_tag : (contig, start, end, strand)}
+    if os.path.exists(gff):
+        with open(gff, 'r') as f:
+            for line in f:
+                if line.startswith('##FASTA'):
+                    break
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 9 or fields[2] == 'gene':
+                    continue
+                for attr in fields[8].split(';'):
+                    if attr.startswith('locus_tag='):
+                        coords[attr[10 : ]] = (fields[0], int(fields[3]), int(fields[4]), STRANDS.index(fields[6]) if fields[6] in STRANDS else 0)
+                        break
+    features = {c : [] for c in ['locus_tag', 'start', 'end', 'strand'] + STRING_COLUMNS}
+    with open(tsv, 'r') as f:
+        f.readline()  # Skip the header line: locus_tag, ftype, length_bp, gene, EC_number, COG, product
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 7 or fields[1] == 'gene':
+                continue
+            contig, start, end, strand = coords.get(fields[0], ('', 0, 0, 0))
+            for c, v in zip(['locus_tag', 'ftype', 'gene', 'ec', 'product', 'contig', 'start', 'end', 'strand'],\
+                            [fields[0], fields[1], fields[3], fields[4], fields[6], contig, start, end, strand]):
+                features[c].append(v)
+    return features
+
+
+if __name__ == '__main__':
+    main()
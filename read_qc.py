@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+Trim paired-end reads and compute read-QC metrics in a single pass over each pair of gzip-compressed FASTQ files.
+This script replaces the Trimmomatic -> FastQC -> MultiQC chain of trimmomatic_pe.nf with a Python stage.
+
+Example commands:
+    python read_qc.py -r readsets.tsv -o trimmed --crop 250 --window 5:30 --min_len 50 -n 8
+    python read_qc.py -r readsets.tsv -o trimmed --crop 250 --window 5:30 --min_len 50 -s SGE -q 20
+    python read_qc.py -1 reads/isolate_1_1.fastq.gz -2 reads/isolate_1_2.fastq.gz -i isolate_1 -o trimmed --crop 250
+    python read_qc.py -o trimmed --summarise
+
+Output files (under --outdir):
+    {isolate}_1.fastq.gz, {isolate}_2.fastq.gz: read pairs of which both reads pass the trimming rules. These files are
+        named as trimmomatic_pe.nf publishes them, not as Trimmomatic writes them in the work directory
+        ({isolate}__paired_1.fastq.gz and {isolate}__paired_2.fastq.gz), so patterns matching '__paired_' must be
+        replaced with '_1' and '_2';
+    {isolate}__unpaired_1.fastq.gz, {isolate}__unpaired_2.fastq.gz: reads whose mates are dropped, named as Trimmomatic
+        writes them (trimmomatic_pe.nf does not publish these files);
+    qc/{isolate}.json: QC metrics of each isolate;
+    qc_summary.tsv: a table of QC metrics of all isolates.
+
+Notes:
+    1. Dependencies: Python >= 3.6, NumPy.
+    2. Trimming rules are applied in the order of Trimmomatic's arguments used in trimmomatic_pe.nf: CROP (--crop),
+       SLIDINGWINDOW (--window) and MINLEN (--min_len). As Trimmomatic does, the sliding window scans from the 5' end,
+       cuts the read at the first window whose mean quality is below the threshold, and keeps leading bases of that
+       window whose qualities reach the threshold.
+    3. Reads are processed in batches (--batch) with NumPy arithmetic on quality matrices.
+    4. Without --scheduler, isolates are processed in a local process pool of --ncpus processes and qc_summary.tsv is
+       written at the end. With --scheduler, job scripts are submitted through pipeline_modules.run_jobs, and
+       qc_summary.tsv is compiled afterwards from qc/*.json files using --summarise. Each job processes a single
+       isolate given by --read1, --read2 and --isolates, so that it does not read the readset file.
+
+Copyright (C) 2026 Yu Wan <wanyuac@126.com>
+Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
+First version: 19 Oct 2026; the latest update: 19 Oct 2026
+"""
+
+import os
+import sys
+import glob
+import gzip
+import json
+import numpy as np
+from itertools import islice
+from collections import namedtuple
+from multiprocessing import Pool
+from argparse import ArgumentParser
+from pipeline_modules import import_readsets, check_dir, run_jobs, add_slurm_arguments, add_metrics_arguments, Tool, Resources, conda_environment
+
+Readset = namedtuple('Readset', ['r1', 'r2'])  # The structure of read sets returned by pipeline_modules.import_readsets
+METRICS = ['Read_pairs_in', 'Read_pairs_out', 'Unpaired_1', 'Unpaired_2', 'Dropped_pairs', 'Bases_in', 'Bases_out',\
+           'Mean_length_out', 'Mean_quality_out', 'Q30_percent_out', 'GC_percent_out']
+
+
+def parse_arguments():
+    parser = ArgumentParser(description = "Trim paired-end reads and compute QC metrics in a single pass")
+
+    # Trimming parameters
+    parser.add_argument('--readsets', '-r', dest = 'readsets', type = str, required = False, default = '', help = "A tab-delimited, header-free file of three columns ID\\tRead_1\\tRead_2")
+    parser.add_argument('--outdir', '-o', dest = 'outdir', type = str, required = False, default = 'trimmed', help = "Output directory (default: trimmed)")
+    parser.add_argument('--crop', '-c', dest = 'crop', type = int, required = False, default = 0, help = "Maximum read length (CROP; default: 0, no cropping)")
+    parser.add_argument('--window', '-w', dest = 'window', type = str, required = False, default = '', help = "Window size and required mean quality (SLIDINGWINDOW), such as '5:30' (default: none)")
+    parser.add_argument('--min_len', '-l', dest = 'min_len', type = int, required = False, default = 0, help = "Minimum read length after trimming (MINLEN; default: 0, no filter)")
+    parser.add_argument('--phred', '-p', dest = 'phred', type = int, required = False, default = 33, help = "Offset of Phred quality scores (default: 33)")
+    parser.add_argument('--batch', '-b', dest = 'batch', type = int, required = False, default = 20000, help = "Number of read pairs per batch (default: 20000)")
+    parser.add_argument('--read1', '-1', dest = 'read1', type = str, required = False, default = '', help = "(Optional) Read file 1 of a single isolate named by --isolates, instead of --readsets")
+    parser.add_argument('--read2', '-2', dest = 'read2', type = str, required = False, default = '', help = "(Optional) Read file 2 of a single isolate named by --isolates, instead of --readsets")
+    parser.add_argument('--isolates', '-i', dest = 'isolates', nargs = '+', type = str, required = False, default = None, help = "(Optional) Only process these isolates in the readset file")
+    parser.add_argument('--summarise', '-a', dest = 'summarise', action = 'store_true', help = "Only compile qc/*.json files under --outdir into qc_summary.tsv")
+
+    # Job parameters
+    parser.add_argument('--ncpus', '-n', dest = 'ncpus', type = int, required = False, default = 1, help = "Number of processes of the local pool (default: 1)")
+    parser.add_argument('--scheduler', '-s', dest = 'scheduler', type = str, required = False, default = '', help = "(Optional) Submit jobs to a job scheduler (SGE/PBS/Slurm/local/bash) instead of using the local pool")
+    parser.add_argument('--conda', '-e', dest = 'conda', type = str, required = False, default = '', help = "(Optional) Conda environment of jobs, which provides Python and NumPy")
+    parser.add_argument('--mem', '-m', dest = 'mem', type = str, required = False, default = '4', help = "Memory size (GB) to be requested per job (default: 4)")
+    parser.add_argument('--queue', '-q', dest = 'queue', type = int, required = False, default = 20, help = "Size of each serial job queue (default: 20)")
+    parser.add_argument('--resume', '-u', dest = 'resume', action = 'store_true', help = "Skip isolates whose QC metrics exist")
+    parser.add_argument('--debug', '-d', dest = 'debug', action = 'store_true', help = "Only generate job script but do not submit it")
+    add_slurm_arguments(parser)
+    add_metrics_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    qc_dir = os.path.join(args.outdir, 'qc')
+    if args.summarise:
+        write_summary(sorted(glob.glob(os.path.join(qc_dir, '*.json'))), os.path.join(args.outdir, 'qc_summary.tsv'))
+        return
+    if args.read1 != '' or args.read2 != '':  # A single isolate, such as in a job script
+        if args.read1 == '' or args.read2 == '' or args.isolates is None or len(args.isolates) != 1:
+            print("Error: arguments --read1 and --read2 require each other and a single isolate name of --isolates.", file = sys.stderr)
+            sys.exit(1)
+        for r in [args.read1, args.read2]:
+            if not os.path.exists(r):
+                print(f"Error: read file {r} is not accessible.", file = sys.stderr)
+                sys.exit(1)
+        readsets = {args.isolates[0] : Readset(r1 = args.read1, r2 = args.read2)}
+    elif args.readsets == '':
+        print("Error: argument --readsets or arguments --read1 and --read2 are required unless --summarise is set.", file = sys.stderr)
+        sys.exit(1)
+    else:
+        readsets = import_readsets(args.readsets)
+        if args.isolates is not None:
+            readsets = {i : readsets[i] for i in args.isolates if i in readsets}
+    check_dir(args.outdir)
+    check_dir(qc_dir)
+    if args.scheduler != '':
+        run_jobs(ReadQC(args), readsets, args.queue, args.outdir, args.scheduler, args.debug, args.resume, args.array, args.node_cores, event_log = args.event_log)
+        return
+    rules = trimming_rules(args)
+    tasks = [(i, r.r1, r.r2, args.outdir, rules, args.batch) for i, r in readsets.items()]
+    if args.resume:
+        tasks = [t for t in tasks if not os.path.exists(os.path.join(qc_dir, t[0] + '.json'))]
+    with Pool(args.ncpus) as pool:
+        try:
+            for i in pool.imap_unordered(process_readset, tasks):
+                print(f"Finished processing reads of isolate {i}.", file = sys.stderr)
+        except ValueError as e:  # Raised by worker processes
+            print(f"Error: {e}", file = sys.stderr)
+            sys.exit(1)
+    if args.isolates is None:
+        write_summary([os.path.join(qc_dir, i + '.json') for i in readsets.keys()], os.path.join(args.outdir, 'qc_summary.tsv'))
+    return
+
+
+class ReadQC(Tool):
+    """ Runs this script for each isolate in job scripts """
+    name = "ReadQC"
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.outdir = os.path.abspath(args.outdir)
+        self.options = f"--crop {args.crop} --min_len {args.min_len} --phred {args.phred} --batch {args.batch}"
+        if args.window != '':
+            self.options += f" --window {args.window}"
+        return
+
+    def resources(self):
+        return Resources(ncpus = "1", mem = self.args.mem, walltime = "24:00:00", sge_vmem = True)
+
+    def environment(self, scheduler):
+        return conda_environment(scheduler, self.args.conda) if self.args.conda != '' else ''
+
+    def command(self, i, reads):
+        return f"python {os.path.abspath(__file__)} -1 {os.path.abspath(reads.r1)} -2 {os.path.abspath(reads.r2)} -o {self.outdir} {self.options} -i {i}"
+
+    def outputs(self, i):
+        return [os.path.join(self.outdir, 'qc', i + '.json')]
+
+
+def trimming_rules(args):
+    """ Returns a tuple (crop, window size, window quality, minimum length, Phred offset) """
+    if args.window != '':
+        try:
+            w, q = [int(x) for x in args.window.split(':')]
+        except ValueError:
+            print(f"Error: argument --window {args.window} cannot be parsed.", file = sys.stderr)
+            sys.exit(1)
+    else:
+        w, q = 0, 0
+    return args.crop, w, q, args.min_len, args.phred
+
+
+def read_fastq_batches(fastq, batch):
+    """ A generator of lists of FASTQ records (header, sequence, quality) in bytes """
+    with gzip.open(fastq, 'rb') as f:
+        while True:
+            lines = list(islice(f, batch * 4))
+            if len(lines) == 0:
+                break
+            if len(lines) % 4 != 0:
+                raise ValueError(f"{fastq} ends with an incomplete record.")
+            yield [(lines[k].rstrip(b'\n'), lines[k + 1].rstrip(b'\n'), lines[k + 3].rstrip(b'\n')) for k in range(0, len(lines), 4)]
+
+
+def padded_matrix(strings, lengths):
+    """ Returns a uint8 matrix of byte strings padded with zeros """
+    m = np.zeros((len(strings), max(int(lengths.max()), 1)), dtype = np.uint8)
+    m[np.arange(m.shape[1]) < lengths[:, None]] = np.frombuffer(b''.join(strings), dtype = np.uint8)
+    return m
+
+
+def trim_lengths(quals, lengths, rules):
+    """
+    Returns the numbers of bases to keep in reads after CROP and SLIDINGWINDOW, given a matrix of Phred scores (reads
+    x positions) and read lengths.
+    """
+    crop, w, q, _, _ = rules
+    keep = np.minimum(lengths, crop) if crop > 0 else lengths.copy()
+    if w > 0 and quals.shape[1] >= w:
+        cum = np.zeros((quals.shape[0], quals.shape[1] + 1), dtype = np.int64)
+        np.cumsum(quals, axis = 1, out = cum[:, 1 : ])
+        sums = cum[:, w : ] - cum[:, : -w]  # Sum of qualities of the window starting at each position
+        starts = np.arange(sums.shape[1])
+        fail = (sums < q * w) & (starts <= (keep - w)[:, None])
+        failed = fail.any(axis = 1)
+        rows = np.nonzero(failed)[0]
+        first = fail[rows].argmax(axis = 1)  # Start of the first failed window
+        window = quals[rows[:, None], first[:, None] + np.arange(w)] >= q
+        leading = np.where(window.all(axis = 1), w, window.argmin(axis = 1))  # Leading bases of the window that reach the threshold
+        keep[rows] = first + leading
+    return keep
+
+
+def process_readset(task):
+    """ Trims a pair of FASTQ files, writes trimmed reads and QC metrics, and returns the isolate name """
+    i, r1, r2, outdir, rules, batch = task
+    _, _, _, min_len, phred = rules
+    outputs = [os.path.join(outdir, f) for f in [f'{i}_1.fastq.gz', f'{i}_2.fastq.gz', f'{i}__unpaired_1.fastq.gz', f'{i}__unpaired_2.fastq.gz']]
+    handles = [gzip.open(f + '.tmp', 'wb', compresslevel = 4) for f in outputs]
+    m = {k : 0 for k in ['Read_pairs_in', 'Read_pairs_out', 'Unpaired_1', 'Unpaired_2', 'Dropped_pairs', 'Bases_in', 'Bases_out']}
+    qual_sum, q30, gc = 0, 0, 0
+    for batch_1, batch_2 in zip_batches(read_fastq_batches(r1, batch), read_fastq_batches(r2, batch), i):
+        kept = list()
+        for records in [batch_1, batch_2]:
+            lengths = np.array([len(s) for _, s, _ in records], dtype = np.int64)
+            quals = padded_matrix([x for _, _, x in records], lengths).astype(np.int16) - phred
+            keep = trim_lengths(quals, lengths, rules)
+            passed = keep >= max(min_len, 1)
+            keep[~passed] = 0
+            bases = np.arange(quals.shape[1]) < keep[:, None]  # Bases retained in each read
+            seqs = padded_matrix([s for _, s, _ in records], lengths)
+            m['Bases_in'] += int(lengths.sum())
+            qual_sum += int(quals[bases].sum())
+            q30 += int(np.count_nonzero(quals[bases] >= 30))
+            gc += int(np.count_nonzero(np.isin(seqs[bases], [67, 71, 99, 103])))  # C, G, c, g
+            kept.append((keep, passed))
+        (keep_1, pass_1), (keep_2, pass_2) = kept
+        m['Read_pairs_in'] += len(batch_1)
+        m['Read_pairs_out'] += int(np.count_nonzero(pass_1 & pass_2))
+        m['Unpaired_1'] += int(np.count_nonzero(pass_1 & ~pass_2))
+        m['Unpaired_2'] += int(np.count_nonzero(~pass_1 & pass_2))
+        m['Dropped_pairs'] += int(np.count_nonzero(~pass_1 & ~pass_2))
+        m['Bases_out'] += int(keep_1.sum() + keep_2.sum())
+        for mate, (records, keep, passed, passed_mate) in enumerate([(batch_1, keep_1, pass_1, pass_2), (batch_2, keep_2, pass_2, pass_1)]):
+            paired = handles[mate]
+            unpaired = handles[mate + 2]
+            out_paired, out_unpaired = list(), list()
+            for (header, seq, qual), k, p, pm in zip(records, keep.tolist(), passed.tolist(), passed_mate.tolist()):
+                if p:
+                    (out_paired if pm else out_unpaired).append(b'%s\n%s\n+\n%s\n' % (header, seq[ : k], qual[ : k]))
+            paired.write(b''.join(out_paired))
+            unpaired.write(b''.join(out_unpaired))
+    for h in handles:
+        h.close()
+    for f in outputs:
+        os.replace(f + '.tmp', f)
+    n_out = m['Read_pairs_out'] * 2 + m['Unpaired_1'] + m['Unpaired_2']
+    m['Mean_length_out'] = round(m['Bases_out'] / n_out, 2) if n_out > 0 else 0
+    m['Mean_quality_out'] = round(qual_sum / m['Bases_out'], 2) if m['Bases_out'] > 0 else 0
+    m['Q30_percent_out'] = round(100 * q30 / m['Bases_out'], 2) if m['Bases_out'] > 0 else 0
+    m['GC_percent_out'] = round(100 * gc / m['Bases_out'], 2) if m['Bases_out'] > 0 else 0
+    with open(os.path.join(outdir, 'qc', i + '.json'), 'w') as f:
+        json.dump(m, f)
+    return i
+
+
+def zip_batches(batches_1, batches_2, i):
+    """ Pairs up batches of the two FASTQ files of isolate i, which must have the same number of reads """
+    for batch_1, batch_2 in zip(batches_1, batches_2):
+        if len(batch_1) != len(batch_2):
+            raise ValueError(f"FASTQ files of isolate {i} have different numbers of reads.")
+        yield batch_1, batch_2
+    if next(batches_1, None) is not None or next(batches_2, None) is not None:
+        raise ValueError(f"FASTQ files of isolate {i} have different numbers of reads.")
+
+
+def write_summary(json_files, tsv):
+    """ Compiles QC metrics of isolates into a TSV file """
+    with open(tsv, 'w') as out:
+        out.write('\t'.join(['Isolate'] + METRICS) + '\n')
+        for f in json_files:
+            if not os.path.exists(f):
+                print(f"Warning: QC metrics file {f} is not found.", file = sys.stderr)
+                continue
+            with open(f, 'r') as fh:
+                m = json.load(fh)
+            out.write('\t'.join([os.path.basename(f)[ : -5]] + [str(m[k]) for k in METRICS]) + '\n')
+    print(f"QC metrics have been compiled into {tsv}.", file = sys.stderr)
+    return
+
+
+if __name__ == '__main__':
+    main()
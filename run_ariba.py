@@ -1,6 +1,6 @@
 #! /usr/bin/env python
 """
-Submit ARIBA jobs to an HPC. Supports SGE and PBS job schedulers.
+Submit ARIBA jobs to an HPC. Supports SGE, PBS and Slurm job schedulers as well as local runs.
 
 Notes:
     1. Dependencies: anaconda, Python >= 3.6 (for the use of f-strings).
@@ -9,15 +9,12 @@ Notes:
 
 Copyright (C) 2021 Yu Wan <wanyuac@126.com>
 Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
-First version: 22 Oct 2021; the latest update: 22 Oct 2021
+First version: 22 Oct 2021; the latest update: 19 Oct 2026
 """
 
 import os
-import sys
-import time
-import subprocess
 from argparse import ArgumentParser
-from pipeline_modules import import_readsets, check_dir, write_job_script
+from pipeline_modules import import_readsets, check_dir, run_jobs, add_slurm_arguments, add_metrics_arguments, add_dedup_arguments, deduplicate_readsets, Tool, Resources, conda_environment
 
 def parse_arguments():
     parser = ArgumentParser(description = "Submit ARIBA jobs to the HPC")
@@ -35,82 +32,52 @@ def parse_arguments():
     parser.add_argument('--cpus', '-n', dest = 'cpus', type = str, required = False, default = '8', help = "Number of computational cores to be requested (default: 8)")
     parser.add_argument('--mem', '-m', dest = 'mem', type = str, required = False, default = '8', help = "Memory size (GB) to be requested (default: 8)")
     parser.add_argument('--queue', '-q', dest = 'queue', type = int, required = False, default = 10, help = "Size of each serial job queue")
-    parser.add_argument('--scheduler', '-s', dest = 'scheduler', type = str, required = False, default = 'SGE', help = "Job scheduler (SGE/PBS); default: SGE")
+    parser.add_argument('--scheduler', '-s', dest = 'scheduler', type = str, required = False, default = 'SGE', help = "Job scheduler (SGE/PBS/Slurm/local/bash); default: SGE")
+    parser.add_argument('--resume', '-u', dest = 'resume', action = 'store_true', help = "Skip isolates whose ARIBA reports exist")
     parser.add_argument('--debug', '-d', dest = 'debug', action = 'store_true', help = "Only generate job script but do not submit it")
+    add_slurm_arguments(parser)
+    add_metrics_arguments(parser)
+    add_dedup_arguments(parser)
     return parser.parse_args()
 
 
 def main():
     args = parse_arguments()
     readsets = import_readsets(args.readsets)
+    readsets, aliases = deduplicate_readsets(readsets, args)
     check_dir(args.outdir)  # Check existance of the parental output directory
-    queue = list()
-    scripts = list()
-    k = 0  # Counter of isolates in a queue
-    n = 0  # Number of scripts to be written
-    for i in readsets.keys():  # Create and submit scripts of serial jobs based on args.queue
-        k += 1
-        queue.append(i)
-        if k == args.queue:  # When the current queue becomes full
-            n += 1
-            scripts.append(write_job_script(create_job_script({genome : readsets[genome] for genome in queue}, args.conda, args.db, args.cov, args.min_id, args.kmers,\
-                                                               args.outdir, args.mem, args.cpus, args.scheduler),\
-                                            k, n, args.outdir, args.scheduler))  # Append the path of the new script to list 'scripts'
-            queue = list()
-            k = 0
-    if k > 0:  # When there are remaining tasks in the last queue.
-        n += 1
-        scripts.append(write_job_script(create_job_script({genome : readsets[genome] for genome in queue}, args.conda, args.db, args.cov, args.min_id, args.kmers,\
-                                                           args.outdir, args.mem, args.cpus, args.scheduler),\
-                                        k, n, args.outdir, args.scheduler))
-    if not args.debug:
-        for s in scripts:
-            print("Submit job script " + s, file = sys.stdout)
-            p = subprocess.Popen(["qsub", s])  # Do not use parameters 'shell = True, stdin = None, stdout = None, stderr = None, close_fds = True', or the job will not be submitted successfully.
-            time.sleep(1)
+    run_jobs(ARIBA(args), readsets, args.queue, args.outdir, args.scheduler, args.debug, args.resume, args.array, args.node_cores, aliases, event_log = args.event_log)
     return
 
 
-def create_job_script(readsets, conda_env, db, cov, min_id, kmers, outdir, mem, cpus, scheduler):
-    outdir = os.path.abspath(outdir)
-    if scheduler == "SGE":
-        script = f"""#!/bin/bash
-# SGE configurations
-#$ -N ARIBA
-#$ -S /bin/bash
-#$ -pe multithread {cpus}
-#$ -l h_vmem={mem}G
-
-# Environmental settings
-source $HOME/.bash_profile
-source /etc/profile.d/modules.sh
-module purge
-module load anaconda/5.3.1_python3
-conda activate {conda_env}
-cd {outdir}
-
-# ARIBA jobs"""
-    else:  # PBS job script
-        script = f"""#!/bin/bash
-# PBS configurations
-#PBS -N ARIBA
-#PBS -l select=1:ncpus=1:mem={mem}gb:ompthreads={cpus}
-#PBS -l walltime=24:00:00
-
-# Environmental settings
-module load anaconda3/personal
-source activate {conda_env}
-cd {outdir}
-
-# ARIBA jobs"""
-
-    genomes = list(readsets.keys())
-    for g in genomes:
-        reads = readsets[g]
+class ARIBA(Tool):
+    name = "ARIBA"
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.outdir = os.path.abspath(args.outdir)
+        return
+
+    def resources(self):
+        return Resources(ncpus = self.args.cpus, mem = self.args.mem, walltime = "24:00:00", sge_vmem = True)
+
+    def environment(self, scheduler):
+        return conda_environment(scheduler, self.args.conda)
+
+    def prologue(self):
+        return f"cd {self.outdir}"
+
+    def command(self, g, reads):
+        args = self.args
         # ARIBA creates temporary directories under the parental tmp directory with random names, so we don't need to manually create a temporary directory for each isolate.
-        script += f"""\nariba run --assembler spades --spades_mode wgs --assembly_cov {cov} --nucmer_min_id {min_id} --force --spades_options "-k {kmers}" --threads {cpus} --tmp_dir {outdir} {db} {reads.r1} {reads.r2} {outdir}/{g}"""
-    return script
+        return f"""ariba run --assembler spades --spades_mode wgs --assembly_cov {args.cov} --nucmer_min_id {args.min_id} --force --spades_options "-k {args.kmers}" --threads {args.cpus} --tmp_dir {self.outdir} {args.db} {reads.r1} {reads.r2} {self.outdir}/{g}"""
+
+    def outputs(self, g):
+        return [os.path.join(self.outdir, g, "report.tsv")]
+
+    def alias(self, g, d):
+        return f"ln -sfn {self.outdir}/{g} {self.outdir}/{d}"  # Aliases the whole output directory of isolate g
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,6 +1,6 @@
 #! /usr/bin/env python
 """
-Submit GeneFinder jobs to an HPC (https://github.com/phe-bioinformatics/gene_finder). The script supports SGE and PBS job schedulers.
+Submit GeneFinder jobs to an HPC (https://github.com/phe-bioinformatics/gene_finder). The script supports SGE, PBS and Slurm job schedulers as well as local runs.
 
 Notes:
     1. Dependencies: anaconda, Python >= 3.6 (for the use of f-strings)
@@ -8,15 +8,13 @@ Notes:
 
 Copyright (C) 2021 Yu Wan <wanyuac@126.com>
 Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
-First version: 5 Aug 2021; the latest update: 24 Feb 2022
+First version: 5 Aug 2021; the latest update: 19 Oct 2026
 """
 
 import os
-import sys
-import time
-import subprocess
+import re
 from argparse import ArgumentParser
-from pipeline_modules import import_readsets, check_dir, write_job_script
+from pipeline_modules import import_readsets, check_dir, run_jobs, add_slurm_arguments, add_metrics_arguments, add_dedup_arguments, deduplicate_readsets, Tool, Resources
 
 
 def parse_arguments():
@@ -26,98 +24,77 @@ def parse_arguments():
     parser.add_argument("--outdir", "-o", dest = "outdir", type = str, required = False, default = "output", help = "Parental output directory")
     parser.add_argument("--mem", "-m", dest = "mem", type = str, required = False, default = "8", help = "Memory size (GB) to be requested (default: 8)")
     parser.add_argument("--queue", "-q", dest = "queue", type = int, required = False, default = 10, help = "Size of each serial job queue")
-    parser.add_argument("--scheduler", "-s", dest = "scheduler", type = str, required = False, default = "SGE", help = "Job scheduler (SGE/PBS); default: SGE")
+    parser.add_argument("--scheduler", "-s", dest = "scheduler", type = str, required = False, default = "SGE", help = "Job scheduler (SGE/PBS/Slurm/local/bash); default: SGE")
+    parser.add_argument("--resume", "-u", dest = "resume", action = "store_true", help = "Skip isolates whose XML results exist")
     parser.add_argument("--debug", "-d", dest = "debug", action = "store_true", help = "Only generate job script but do not submit it")
+    add_slurm_arguments(parser)
+    add_metrics_arguments(parser)
+    add_dedup_arguments(parser)
     return parser.parse_args()
 
 
 def main():
     args = parse_arguments()
     readsets = import_readsets(args.readsets)
-    submit = not args.debug
+    readsets, aliases = deduplicate_readsets(readsets, args)
     check_dir(args.outdir)
-    queue = list()
-    scripts = list()
-    k = 0  # Counter of genomes of a queue
-    n = 0  # Number of scripts to be written
-    for i in readsets.keys():  # Create and submit scripts of serial jobs based on args.queue
-        k += 1
-        queue.append(i)
-        if k == args.queue:  # When the current queue becomes full
-            n += 1
-            scripts.append(write_job_script(create_job_script({genome : readsets[genome] for genome in queue}, args.db, args.mem, args.outdir, args.scheduler),\
-                                            k, n, args.outdir, args.scheduler))  # Append the path of the new script to list 'scripts'
-            queue = list()
-            k = 0
-    if k > 0:  # When there are remaining tasks in the last queue.
-        n += 1
-        scripts.append(write_job_script(create_job_script({genome : readsets[genome] for genome in queue}, args.db, args.mem, args.outdir, args.scheduler),\
-                                        k, n, args.outdir, args.scheduler))
-    if submit:
-        for s in scripts:
-            print("Submit job script " + s, file = sys.stdout)
-            p = subprocess.Popen(["qsub", s])  # Do not use parameters 'shell = True, stdin = None, stdout = None, stderr = None, close_fds = True', or the job will not be submitted successfully.
-            time.sleep(1)
+    run_jobs(GeneFinder(args), readsets, args.queue, args.outdir, args.scheduler, args.debug, args.resume, args.array, args.node_cores, aliases, event_log = args.event_log)
     return
 
 
-def create_job_script(readsets, db, mem, outdir, scheduler):
-    outdir = os.path.abspath(outdir)
-    if scheduler == "SGE":
-        script = f"""#!/bin/bash
-# SGE configurations
-#$ -N GeneFinder
-#$ -S /bin/bash
-#$ -l h_vmem={mem}G
-
-# Environmental settings
-source $HOME/.bash_profile
-source /etc/profile.d/modules.sh
-module purge
-#module load phe/gene_finder/2-2
-module unuse /phengs/hpc_software/Modules/modulefiles
-module use /phengs/hpc_software/Modules/production
-module load phe/gene_finder
-cd {outdir}
-
-# Genefinder jobs"""
-    else:  # PBS job script
-        script = f"""#!/bin/bash
-# PBS configurations
-#PBS -N GeneFinder
-#PBS -l select=1:ncpus=1:mem={mem}gb
-#PBS -l walltime=24:00:00
-
-# Environmental settings
-#module load phe/gene_finder/2-2
+class GeneFinder(Tool):
+    name = "GeneFinder"
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.outdir = os.path.abspath(args.outdir)
+        return
+
+    def resources(self):
+        return Resources(ncpus = "1", mem = self.args.mem, walltime = "24:00:00", sge_vmem = True)
+
+    def environment(self, scheduler):
+        env = """#module load phe/gene_finder/2-2
 module unuse /phengs/hpc_software/Modules/modulefiles
 module use /phengs/hpc_software/Modules/production
-module load phe/gene_finder
-cd {outdir}
-
-# Genefinder jobs"""
-
-    genomes = list(readsets.keys())
-    for g in genomes:
-        reads = readsets[g]
-        script += f"""\ngene_finder.py -1 {reads.r1} -2 {reads.r2} -output_directory {g} --gene_file_directory {db}"""
-    
-    script += """\n
-# Move output files
-cd %s
-genomes=(%s)
-
-for g in ${genomes[@]}
-do
+module load phe/gene_finder"""
+        if scheduler == "SGE":
+            env = "source $HOME/.bash_profile\nsource /etc/profile.d/modules.sh\nmodule purge\n" + env
+        return env
+
+    def prologue(self):
+        return """cd %s
+
+# Move the result of isolate $1 to the output directory
+function move_result {
+    g=$1
     if [ -f "$g/${g}_1.results.xml" ]
     then
         mv $g/${g}_1.results.xml ${g}.xml
     else
         echo "Warning: GeneFinder result of isolate $g was not found."
     fi
-done
-""" % (outdir, " ".join(genomes))
-    return script
+}""" % self.outdir
+
+    def command(self, g, reads):
+        return f"""gene_finder.py -1 {reads.r1} -2 {reads.r2} -output_directory {g} --gene_file_directory {self.args.db}
+move_result {g}"""
+
+    def outputs(self, g):
+        return [os.path.join(self.outdir, g + ".xml")]
+
+    def alias(self, g, d):
+        """
+        Copies the result of isolate g for its duplicate d with the sample ID rewritten, because genefinder_xml2tsv.py
+        takes isolate names from sample IDs ({isolate}_1) in XML files rather than from filenames.
+        """
+        src, dst = self.outputs(g)[0], self.outputs(d)[0]
+        return f"""if [ -f {src} ]; then sed 's/<ngs_sample id="{sed_escape(g)}_1"/<ngs_sample id="{sed_escape(d, True)}_1"/' {src} > {dst}; fi"""
+
+
+def sed_escape(s, replacement = False):
+    """ Escapes special characters of a sed pattern or replacement (replacement = True) """
+    return re.sub(r'([\\/&])' if replacement else r'([][\\/.*^$])', r'\\\1', s)
 
 
 if __name__ == "__main__":
@@ -1,23 +1,26 @@
 #! /usr/bin/env python
 """
-Submit PHEnix jobs to an HPC (https://github.com/phe-bioinformatics/PHEnix). The script supports SGE and PBS job schedulers.
+Submit PHEnix jobs to an HPC (https://github.com/phe-bioinformatics/PHEnix). The script supports SGE, PBS and Slurm job schedulers as well as local runs.
 
 Notes:
     1. Dependencies: anaconda, Python >= 3.6 (for the use of f-strings)
     2. Users may need to edit this script for their HPCs. For example, renaming conda environments.
     3. gatk fails at the stage of variant calling if insufficient memory is allocated.
+    4. Without --ref_cache, run phenix.py prepare_reference before using this script. With --ref_cache, the reference is
+       copied into a cache keyed by its content hash, and the first job that starts builds its indexes once (guarded by
+       flock) while other jobs wait and reuse them. Option --stage_dir copies the prepared reference to a node-local
+       directory (for example, '$TMPDIR') once per node, where the first job copies it and other jobs reuse the copy.
+       The flock command must work on the file systems of the cache and the staging directory.
 
 Copyright (C) 2021 Yu Wan <wanyuac@126.com>
 Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
-First version: 8 Aug 2021; the latest update: 11 Jan 2022
+First version: 8 Aug 2021; the latest update: 19 Oct 2026
 """
 
 import os
 import sys
-import time
-import subprocess
 from argparse import ArgumentParser
-from pipeline_modules import import_readsets, check_dir, write_job_script
+from pipeline_modules import import_readsets, check_dir, run_jobs, add_slurm_arguments, add_metrics_arguments, add_dedup_arguments, deduplicate_readsets, Tool, Resources, cache_reference
 
 
 def parse_arguments():
@@ -25,7 +28,9 @@ def parse_arguments():
 	
 	# Software arguments
 	parser.add_argument("--readsets", "-r", dest = "readsets", type = str, required = True, help = "A tab-delimited, header-free file of three columns ID\\tRead_1\\tRead_2")
-	parser.add_argument("--ref", "-e", dest = "ref", type = str, required = True, help = "Path to a reference FASTA file (Run phenix.py prepare_reference first)")
+	parser.add_argument("--ref", "-e", dest = "ref", type = str, required = True, help = "Path to a reference FASTA file (Run phenix.py prepare_reference first unless --ref_cache is set)")
+	parser.add_argument("--ref_cache", "-c", dest = "ref_cache", type = str, required = False, default = "", help = "(Optional) Directory of the reference cache, where indexes are built once per reference")
+	parser.add_argument("--stage_dir", "-t", dest = "stage_dir", type = str, required = False, default = "", help = "(Optional) Node-local directory to which the cached reference is copied at job start (e.g., '$TMPDIR')")
 	parser.add_argument("--filters", "-f", dest = "filters", type = str, required = False, default = "qual_score:30,min_depth:10,mq_score:30,ad_ratio:0.9", help = "Quality filters for variant calling")
 	parser.add_argument("--outdir", "-o", dest = "outdir", type = str, required = False, default = "output", help = "Parental output directory")
 	parser.add_argument("--keep_temp", "-k", dest = "keep_temp", action = "store_true", help = "Keep temporary files")
@@ -33,79 +38,97 @@ def parse_arguments():
 	# Job arguments
 	parser.add_argument("--mem", "-m", dest = "mem", type = str, required = False, default = "32", help = "Memory size (GB) to be requested (default: 32)")
 	parser.add_argument("--queue", "-q", dest = "queue", type = int, required = False, default = 20, help = "Size of each serial job queue")
-	parser.add_argument("--scheduler", "-s", dest = "scheduler", type = str, required = False, default = "SGE", help = "Job scheduler (SGE/PBS); default: SGE")
+	parser.add_argument("--scheduler", "-s", dest = "scheduler", type = str, required = False, default = "SGE", help = "Job scheduler (SGE/PBS/Slurm/local/bash); default: SGE")
+	parser.add_argument("--resume", "-u", dest = "resume", action = "store_true", help = "Skip isolates whose filtered VCF files exist")
 	parser.add_argument("--debug", "-d", dest = "debug", action = "store_true", help = "Only generate job script but do not submit it")
+	add_slurm_arguments(parser)
+	add_metrics_arguments(parser)
+	add_dedup_arguments(parser, near = False)  # Near-duplicate read sets may be distinct isolates of an outbreak clone.
 	return parser.parse_args()
 
 
 def main():
 	args = parse_arguments()
 	readsets = import_readsets(args.readsets)
-	submit = not args.debug
+	readsets, aliases = deduplicate_readsets(readsets, args)
 	script_dir = os.path.join(args.outdir, "script")
 	vcf_dir = os.path.join(args.outdir, "vcf")
 	for d in [args.outdir, script_dir, vcf_dir]:
 		check_dir(d)
-	queue = list()
-	scripts = list()
 	other_args = "--json --keep-temp" if args.keep_temp else "--json"
-	k = 0  # Counter of genomes of a queue
-	n = 0  # Number of scripts to be written
-	for i in readsets.keys():  # Create and submit scripts of serial jobs based on args.queue
-		k += 1
-		queue.append(i)
-		if k == args.queue:  # When the current queue becomes full
-			n += 1
-			scripts.append(write_job_script(create_job_script({genome : readsets[genome] for genome in queue}, args.ref, args.filters, args.mem,\
-															  vcf_dir, args.scheduler, other_args), k, n, script_dir, args.scheduler))  # Append the path of the new script to list 'scripts'
-			queue = list()
-			k = 0
-	if k > 0:  # When there are remaining tasks in the last queue.
-		n += 1
-		scripts.append(write_job_script(create_job_script({genome : readsets[genome] for genome in queue}, args.ref, args.filters, args.mem,\
-														  vcf_dir, args.scheduler, other_args), k, n, script_dir, args.scheduler))
-	if submit:
-		for s in scripts:
-			print("Submit job script " + s, file = sys.stdout)
-			p = subprocess.Popen(["qsub", s])  # Do not use parameters 'shell = True, stdin = None, stdout = None, stderr = None, close_fds = True', or the job will not be submitted successfully.
-			time.sleep(1)
+	if args.ref_cache != "":
+		ref_setup = reference_setup(cache_reference(args.ref, args.ref_cache), args.stage_dir)
+	elif args.stage_dir != "":
+		print("Error: argument --stage_dir requires --ref_cache.", file = sys.stderr)
+		sys.exit(1)
+	else:
+		ref_setup = f"ref={args.ref}"
+	run_jobs(PHEnix(args, vcf_dir, other_args, ref_setup), readsets, args.queue, script_dir, args.scheduler, args.debug, args.resume, args.array, args.node_cores, aliases, event_log = args.event_log)
 	return
 
 
-def create_job_script(readsets, ref, filters, mem, outdir, scheduler, other_args):
-	outdir = os.path.abspath(outdir)
-	if scheduler == "SGE":
-		script = f"""#!/bin/bash
-# SGE configurations
-#$ -N PHEnix
-#$ -S /bin/bash
-# -l h_vmem={mem}G  # Sometimes the system has an issue in running JAVA when this parameter is given, hence I removed this line out of the SGE script.
-
-# Environmental settings
-source $HOME/.bash_profile
-source /etc/profile.d/modules.sh
-module purge
-module load snp_pipeline/1-4-3
-
-# PHEnix jobs"""
-	else:  # PBS job script
-		script = f"""#!/bin/bash
-# PBS configurations
-#PBS -N PHEnix
-#PBS -l select=1:ncpus=1:mem={mem}gb
-#PBS -l walltime=24:00:00
-
-# Environmental settings
-module load snp_pipeline/1-4-3
-
-# PHEnix jobs"""
-	genomes = list(readsets.keys())
-	for g in genomes:
-		reads = readsets[g]
-		script += f"""\n\n>&2 echo 'Mapping reads of {g}'"""
-		script += f"""\nphenix.py run_snp_pipeline -r1 {reads.r1} -r2 {reads.r2} --reference {ref} --sample-name {g} --mapper bwa --variant gatk --filters '{filters}' --outdir {outdir} {other_args}"""
-	return script
+def reference_setup(entry, stage_dir):
+	"""
+	Returns commands that prepare a cached reference (cf. pipeline_modules.cache_reference) and set variable $ref.
+	Indexes are built by the first job that acquires the lock of the cache entry and are marked by file .prepared.
+	With a staging directory, the first job on each node copies the prepared reference into a temporary directory and
+	renames it into place under a lock, so that other jobs never use a partial copy and skip staged references.
+	"""
+	setup = f"""# Reference preparation
+ref_entry={entry}
+flock $ref_entry.lock -c "[ -f $ref_entry/.prepared ] || (phenix.py prepare_reference --mapper bwa --variant gatk --reference $ref_entry/ref.fasta && touch $ref_entry/.prepared)"
+if [ ! -f $ref_entry/.prepared ]
+then
+    >&2 echo "Error: reference $ref_entry/ref.fasta could not be prepared."
+    exit 1
+fi"""
+	if stage_dir != "":
+		setup += f"""
+ref_dir={stage_dir}/phenix_ref_$(basename $ref_entry)
+mkdir -p {stage_dir}
+[ -f $ref_dir/.prepared ] || flock $ref_dir.lock -c "[ -f $ref_dir/.prepared ] || (ref_tmp=\\$(mktemp -d $ref_dir.XXXXXX) && cp -p $ref_entry/ref.* \\$ref_tmp/ && touch \\$ref_tmp/.prepared && rm -rf $ref_dir && mv \\$ref_tmp $ref_dir)"
+if [ ! -f $ref_dir/.prepared ]
+then
+    >&2 echo "Error: reference $ref_entry/ref.fasta could not be staged in $ref_dir."
+    exit 1
+fi
+ref=$ref_dir/ref.fasta"""
+	else:
+		setup += """
+ref=$ref_entry/ref.fasta"""
+	return setup
+
+
+class PHEnix(Tool):
+	name = "PHEnix"
+
+	def __init__(self, args, outdir, other_args, ref_setup):
+		super().__init__(args)
+		self.outdir = os.path.abspath(outdir)
+		self.other_args = other_args
+		self.ref_setup = ref_setup
+		return
+
+	def resources(self):
+		# SGE's h_vmem is not requested as sometimes the system has an issue in running JAVA when this parameter is given.
+		return Resources(ncpus = "1", mem = self.args.mem, walltime = "24:00:00", sge_vmem = False)
+
+	def environment(self, scheduler):
+		env = "module load snp_pipeline/1-4-3"
+		if scheduler == "SGE":
+			env = "source $HOME/.bash_profile\nsource /etc/profile.d/modules.sh\nmodule purge\n" + env
+		return env
+
+	def prologue(self):
+		return self.ref_setup
+
+	def command(self, g, reads):
+		return f"""\n>&2 echo 'Mapping reads of {g}'
+phenix.py run_snp_pipeline -r1 {reads.r1} -r2 {reads.r2} --reference $ref --sample-name {g} --mapper bwa --variant gatk --filters '{self.args.filters}' --outdir {self.outdir} {self.other_args}"""
+
+	def outputs(self, g):
+		return [os.path.join(self.outdir, g + ".filtered.vcf")]
 
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
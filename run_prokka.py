@@ -1,7 +1,7 @@
 #! /usr/bin/env python
 """
-Submit Prokka jobs to an HPC. Supports SGE and PBS job schedulers. This script assumes all isolates
-are bacteria.
+Submit Prokka jobs to an HPC. Supports SGE, PBS and Slurm job schedulers as well as local runs. This script
+assumes all isolates are bacteria.
 
 Notes:
     1. Dependencies: anaconda, Python >= 3.6 (for the use of f-strings);
@@ -11,15 +11,12 @@ Notes:
 
 Copyright (C) 2021 Yu Wan <wanyuac@126.com>
 Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
-First version: 18 Oct 2021; the latest update: 07 Feb 2023
+First version: 18 Oct 2021; the latest update: 19 Oct 2026
 """
 
 import os
-import sys
-import time
-import subprocess
 from argparse import ArgumentParser
-from pipeline_modules import import_assemblies, check_dir, write_job_script
+from pipeline_modules import import_assemblies, check_dir, run_jobs, add_slurm_arguments, add_metrics_arguments, Tool, Resources, conda_environment
 
 
 def parse_arguments():
@@ -40,88 +37,49 @@ def parse_arguments():
     parser.add_argument('--ncpus', '-n', dest = 'ncpus', type = str, required = False, default = '8', help = "Number of computational cores to be requested (default: 8)")
     parser.add_argument('--mem', '-m', dest = 'mem', type = str, required = False, default = '16', help = "Memory size (GB) to be requested (default: 16)")
     parser.add_argument('--queue', '-q', dest = 'queue', type = int, required = False, default = 20, help = "Size of each serial job queue (default: 20)")
-    parser.add_argument('--scheduler', '-s', dest = 'scheduler', type = str, required = False, default = 'SGE', help = "Job scheduler (SGE/PBS/bash) (default: SGE)")
+    parser.add_argument('--scheduler', '-s', dest = 'scheduler', type = str, required = False, default = 'SGE', help = "Job scheduler (SGE/PBS/Slurm/local/bash) (default: SGE)")
+    parser.add_argument('--resume', '-u', dest = 'resume', action = 'store_true', help = "Skip isolates whose GFF files exist")
     parser.add_argument('--debug', '-d', dest = 'debug', action = 'store_true', help = "Only generate job script but do not submit it")
+    add_slurm_arguments(parser)
+    add_metrics_arguments(parser)
     return parser.parse_args()
 
 
 def main():
     args = parse_arguments()
     assemblies = import_assemblies(args.assemblies)  # Dictionary {i : path}
-    submit = (not args.debug) and (args.scheduler in ['SGE', 'PBS'])
     check_dir(args.outdir)
-    queue = list()
-    scripts = list()
-    k = 0  # Counter of genomes of a queue
-    n = 0  # Number of scripts to be written
-    for i in assemblies.keys():  # Create and submit scripts of serial jobs based on args.queue
-        k += 1
-        queue.append(i)
-        if k == args.queue:
-            n += 1
-            scripts.append(write_job_script(create_job_script({genome : assemblies[genome] for genome in queue}, args.conda, args.genus, args.species, args.strain,\
-                                                              args.proteins, args.mincontiglen, args.rna, args.ncpus, args.mem, args.outdir, args.scheduler),\
-                                            k, n, args.outdir, args.scheduler))  # Append the path of the new script to list 'scripts'
-            queue = list()
-            k = 0
-    if k > 0:  # When there are remaining tasks in the last queue.
-        n += 1
-        scripts.append(write_job_script(create_job_script({genome : assemblies[genome] for genome in queue}, args.conda, args.genus, args.species, args.strain,\
-                                                          args.proteins, args.mincontiglen, args.rna, args.ncpus, args.mem, args.outdir, args.scheduler),\
-                                        k, n, args.outdir, args.scheduler))
-    if submit:
-        for s in scripts:
-            print("Submit job script " + s, file = sys.stdout)
-            p = subprocess.Popen(['qsub', s])  # Do not use parameters 'shell = True, stdin = None, stdout = None, stderr = None, close_fds = True', or the job will not be submitted successfully.
-            time.sleep(1)
-    else:
-        print("Debugging/bash mode: no job is submitted.", file = sys.stdout)
+    run_jobs(Prokka(args), assemblies, args.queue, args.outdir, args.scheduler, args.debug, args.resume, args.array, args.node_cores, event_log = args.event_log)
     return
 
 
-def create_job_script(assemblies, conda_env, genus, species, strain, proteins, mincontiglen, rna, ncpus, mem, outdir, scheduler):
-    outdir = os.path.abspath(outdir)
-    rna_conf = '--quiet' if rna else '--norrna --notrna --quiet'
-    strain_conf = f'--strain {strain} --force' if strain != '' else '--force'
-    if scheduler == 'SGE':
-        script = f"""#!/bin/bash
-# SGE configurations
-#$ -N Prokka
-#$ -S /bin/bash
-#$ -pe multithread {ncpus}
-#$ -l h_vmem={mem}G
-
-# Environmental settings
-source $HOME/.bash_profile
-source /etc/profile.d/modules.sh
-module purge
-module load anaconda/5.3.1_python3
-conda activate {conda_env}
-cd {outdir}
-
-# Prokka jobs"""
-    elif scheduler == 'PBS':  # PBS job script
-        script = f"""#!/bin/bash
-# PBS configurations
-#PBS -N Prokka
-#PBS -l select=1:ncpus={ncpus}:mem={mem}gb:ompthreads={ncpus}
-#PBS -l walltime=24:00:00
-
-# Environmental settings
-module load anaconda3/personal
-source activate {conda_env}
-cd {outdir}
-
-# Prokka jobs"""
-    else:
-        script = f"""#!/bin/bash\nsource activate {conda_env}"""
-
-    for g in assemblies.keys():
-        fasta = assemblies[g]
-        subdir = os.path.join(outdir, g)  # Do not need to run check_dir(subdir) as SPAdes creates an output directory if it does not exist.
-        script += f"""\nprokka --outdir {subdir} --prefix {g} --locustag {g} --increment 1 --kingdom Bacteria --genus {genus} --species {species} {strain_conf} --gcode 11 --addgenes --proteins {proteins} --cpus {ncpus} --mincontiglen {mincontiglen} {rna_conf} {fasta}"""
-    return script
+class Prokka(Tool):
+    name = "Prokka"
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.outdir = os.path.abspath(args.outdir)
+        self.rna_conf = '--quiet' if args.rna else '--norrna --notrna --quiet'
+        self.strain_conf = f'--strain {args.strain} --force' if args.strain != '' else '--force'
+        return
+
+    def resources(self):
+        return Resources(ncpus = self.args.ncpus, mem = self.args.mem, walltime = '24:00:00', sge_vmem = True)
+
+    def environment(self, scheduler):
+        return conda_environment(scheduler, self.args.conda)
+
+    def prologue(self):
+        return f"cd {self.outdir}"
+
+    def command(self, g, fasta):
+        args = self.args
+        subdir = os.path.join(self.outdir, g)  # Do not need to run check_dir(subdir) as Prokka creates an output directory if it does not exist.
+        return f"""prokka --outdir {subdir} --prefix {g} --locustag {g} --increment 1 --kingdom Bacteria --genus {args.genus} --species {args.species} {self.strain_conf} --gcode 11 --addgenes --proteins {args.proteins} --cpus {args.ncpus} --mincontiglen {args.mincontiglen} {self.rna_conf} {fasta}"""
+
+    def outputs(self, g):
+        return [os.path.join(self.outdir, g, g + '.gff')]
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,6 +1,6 @@
 #! /usr/bin/env python
 """
-Submit SPAdes jobs to an HPC. Supports SGE and PBS job schedulers.
+Submit SPAdes jobs to an HPC. Supports SGE, PBS and Slurm job schedulers as well as local runs.
 
 Notes:
     1. Dependencies: anaconda, Python >= 3.6 (for the use of f-strings)
@@ -8,15 +8,12 @@ Notes:
 
 Copyright (C) 2021 Yu Wan <wanyuac@126.com>
 Licensed under the GNU General Public Licence version 3 (GPLv3) <https://www.gnu.org/licenses/>.
-First version: 18 Mar 2021; the latest update: 6 Sep 2021
+First version: 18 Mar 2021; the latest update: 19 Oct 2026
 """
 
 import os
-import sys
-import time
-import subprocess
 from argparse import ArgumentParser
-from pipeline_modules import import_readsets, check_dir, write_job_script
+from pipeline_modules import import_readsets, check_dir, run_jobs, add_slurm_arguments, add_metrics_arguments, add_dedup_arguments, deduplicate_readsets, Tool, Resources, conda_environment
 
 
 def parse_arguments():
@@ -28,94 +25,50 @@ def parse_arguments():
     parser.add_argument("--ncpus", "-n", dest = "ncpus", type = str, required = False, default = "8", help = "Number of computational cores to be requested (default: 8)")
     parser.add_argument("--mem", "-m", dest = "mem", type = str, required = False, default = "16", help = "Memory size (GB) to be requested (default: 16)")
     parser.add_argument("--queue", "-q", dest = "queue", type = int, required = False, default = 10, help = "Size of each serial job queue")
-    parser.add_argument("--scheduler", "-s", dest = "scheduler", type = str, required = False, default = "SGE", help = "Job scheduler (SGE/PBS); default: SGE")
+    parser.add_argument("--scheduler", "-s", dest = "scheduler", type = str, required = False, default = "SGE", help = "Job scheduler (SGE/PBS/Slurm/local/bash); default: SGE")
+    parser.add_argument("--resume", "-u", dest = "resume", action = "store_true", help = "Skip isolates whose assemblies exist")
     parser.add_argument("--debug", "-d", dest = "debug", action = "store_true", help = "Only generate job script but do not submit it")
+    add_slurm_arguments(parser)
+    add_metrics_arguments(parser)
+    add_dedup_arguments(parser)
     return parser.parse_args()
 
 
 def main():
     args = parse_arguments()
     readsets = import_readsets(args.readsets)
-    submit = not args.debug
+    readsets, aliases = deduplicate_readsets(readsets, args)
     check_dir(args.outdir)
     check_dir(os.path.join(args.outdir, "scaffold"))
     check_dir(os.path.join(args.outdir, "contig"))
     check_dir(os.path.join(args.outdir, "log"))
-    queue = list()
-    scripts = list()
-    k = 0  # Counter of genomes of a queue
-    n = 0  # Number of scripts to be written
-    for i in readsets.keys():  # Create and submit scripts of serial jobs based on args.queue
-        k += 1
-        queue.append(i)
-        if k == args.queue:
-            n += 1
-            scripts.append(write_job_script(create_job_script({genome : readsets[genome] for genome in queue}, args.ncpus, args.mem,\
-                                                              args.kmers, args.outdir, args.scheduler, args.highcov), k, n, args.outdir, args.scheduler))  # Append the path of the new script to list 'scripts'
-            queue = list()
-            k = 0
-    if k > 0:  # When there are remaining tasks in the last queue.
-        n += 1
-        scripts.append(write_job_script(create_job_script({genome : readsets[genome] for genome in queue}, args.ncpus, args.mem,\
-                                        args.kmers, args.outdir, args.scheduler, args.highcov), k, n, args.outdir, args.scheduler))
-    if submit:
-        for s in scripts:
-            print("Submit job script " + s, file = sys.stdout)
-            p = subprocess.Popen(["qsub", s])  # Do not use parameters 'shell = True, stdin = None, stdout = None, stderr = None, close_fds = True', or the job will not be submitted successfully.
-            #stdout, stderr = p.communicate()  # The script stucks at the first submission and keeps waiting for it to finish if p.communicate() is called.
-            #print(stdout, file = sys.stdout)
-            #print(stderr, file = sys.stderr)
-            time.sleep(1)
+    run_jobs(SPAdes(args), readsets, args.queue, args.outdir, args.scheduler, args.debug, args.resume, args.array, args.node_cores, aliases, event_log = args.event_log)
     return
 
 
-def create_job_script(readsets, ncpus, mem, kmers, outdir, scheduler, highcov):
-    outdir = os.path.abspath(outdir)
-    if scheduler == "SGE":
-        script = f"""#!/bin/bash
-# SGE configurations
-#$ -N SPAdes
-#$ -S /bin/bash
-#$ -pe multithread {ncpus}
-#$ -l h_vmem={mem}G
-
-# Environmental settings
-source $HOME/.bash_profile
-source /etc/profile.d/modules.sh
-module purge
-module load anaconda/5.3.1_python3
-conda activate spades
-export PATH=$HOME/code/SPAdes-3.15.2/bin:$PATH
-
-# SPAdes jobs"""
-    else:  # PBS job script
-        script = f"""#!/bin/bash
-# PBS configurations
-#PBS -N SPAdes
-#PBS -l select=1:ncpus={ncpus}:mem={mem}gb:ompthreads={ncpus}
-#PBS -l walltime=24:00:00
-
-# Environmental settings
-module load anaconda3/personal
-source activate spades3.15
-
-# SPAdes jobs"""
-
-    genomes = list(readsets.keys())
-    method = "--isolate" if highcov else "--careful"  # See https://github.com/ablab/spades#isolate for details.
-    for g in genomes:
-        reads = readsets[g]
-        subdir = os.path.join(outdir, g)  # Do not need to run check_dir(subdir) as SPAdes creates an output directory if it does not exist.
-        script += f"""\nspades.py -1 {reads.r1} -2 {reads.r2} -o {subdir} --phred-offset 33 {method} --threads {ncpus} --memory {mem} -k '{kmers}'"""
-    
-    script += """\n
-# Move output files
-cd %s
-
-genomes=(%s)
-
-for g in ${genomes[@]}
-do
+class SPAdes(Tool):
+    name = "SPAdes"
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.outdir = os.path.abspath(args.outdir)
+        self.method = "--isolate" if args.highcov else "--careful"  # See https://github.com/ablab/spades#isolate for details.
+        return
+
+    def resources(self):
+        return Resources(ncpus = self.args.ncpus, mem = self.args.mem, walltime = "24:00:00", sge_vmem = True)
+
+    def environment(self, scheduler):
+        if scheduler == "SGE":
+            return conda_environment(scheduler, "spades") + "\nexport PATH=$HOME/code/SPAdes-3.15.2/bin:$PATH"
+        return conda_environment(scheduler, "spades3.15")
+
+    def prologue(self):
+        return """cd %s
+
+# Move output files of isolate $1 out of its SPAdes directory
+function move_outputs {
+    g=$1
     if [ -f "$g/scaffolds.fasta" ]
     then
         mv $g/scaffolds.fasta scaffold/${g}__scaffolds.fna
@@ -128,9 +81,25 @@ do
     else
         echo "Warning: The genome of isolate $g could not be assembled."
     fi
-done
-""" % (outdir, " ".join(genomes))  # This command line cannot use the f-string because of the braces used in the string.
-    return script
+}""" % self.outdir  # This command line cannot use the f-string because of the braces used in the string.
+
+    def command(self, g, reads):
+        args = self.args
+        subdir = os.path.join(self.outdir, g)  # Do not need to run check_dir(subdir) as SPAdes creates an output directory if it does not exist.
+        return f"""spades.py -1 {reads.r1} -2 {reads.r2} -o {subdir} --phred-offset 33 {self.method} --threads {args.ncpus} --memory {args.mem} -k '{args.kmers}'
+move_outputs {g}"""
+
+    def outputs(self, g):
+        return [os.path.join(self.outdir, "scaffold", f"{g}__scaffolds.fna"), os.path.join(self.outdir, "contig", f"{g}__contigs.fna")]
+
+    def moved_files(self, g):
+        """ Returns paths of all files that function move_outputs moves out of the SPAdes directory of isolate g """
+        return [os.path.join(self.outdir, d, f) for d, f in [("scaffold", f"{g}__scaffolds.fna"), ("scaffold", f"{g}__scaffolds.gfa"),\
+                ("scaffold", f"{g}__scaffolds.paths"), ("contig", f"{g}__contigs.fna"), ("contig", f"{g}__contigs.paths"),\
+                ("contig", f"{g}.fastg"), ("log", f"{g}.log")]]
+
+    def alias(self, g, d):
+        return '\n'.join(f"ln -sfn {a} {b}" for a, b in zip(self.moved_files(g), self.moved_files(d)))
 
 
 if __name__ == "__main__":